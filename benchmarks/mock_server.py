@@ -0,0 +1,257 @@
+"""
+Local mock of the Twitter API v2 endpoints TwiFesh uses (see utils.helpers.Url), for offline benchmarks.
+
+- GET  /2/tweets/search/stream        chunked stream of synthetic tweets at `stream_rate` per second,
+                                      '\r\n' heartbeats every `heartbeat` seconds, dropped after `disconnect_after` tweets
+- GET  /2/tweets/search/stream/rules  current rules
+- POST /2/tweets/search/stream/rules  add/delete rules (dry_run supported), adds over `max_rules` rules are refused
+- GET  /2/tweets/?ids=                tweet lookup with includes.users
+- GET  /2/users/by?usernames=         user lookup
+- GET  /2/users/<id>/tweets|followers|following   paginated with meta.next_token, `pages` pages
+- GET  /2/tweets/search/recent|all    paginated search results (next_token), tweets numbered from start_time
+
+Every response carries x-rate-limit headers. Every `fail_every`-th call answers 429.
+
+Run it on its own with: python benchmarks/mock_server.py --port 8765
+"""
+import json, time, argparse, threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class MockConfig:
+    def __init__(self, stream_rate=1000, stream_total=None, heartbeat=20, disconnect_after=None, pages=10, page_size=100,
+                 latency=0.0, fail_every=None, rate_limit=900, window=900, max_rules=None):
+        self.stream_rate = stream_rate #tweets per second on the stream
+        self.stream_total = stream_total #close the stream after this many tweets (None: never)
+        self.heartbeat = heartbeat #seconds of silence before a keep-alive '\r\n'
+        self.disconnect_after = disconnect_after #drop the connection abruptly after this many tweets
+        self.pages = pages #pages served by the paginated endpoints
+        self.page_size = page_size
+        self.latency = latency #seconds added to every call, to emulate the network
+        self.fail_every = fail_every #answer 429 to every n-th call
+        self.rate_limit = rate_limit
+        self.window = window
+        self.max_rules = max_rules #rule cap of the access level, e.g. 5 for Essential (None: no cap)
+
+
+def synthetic_tweet(number):
+    return {'id': str(10**18 + number), 'text': f"Synthetic tweet number {number} about #benchmarks https://t.co/{number:x} @someone",
+            'author_id': str(1000 + number % 500), 'created_at': '2022-07-10T12:34:56.000Z', 'source': 'mock',
+            'public_metrics': {'retweet_count': number % 7, 'reply_count': number % 5, 'like_count': number % 11, 'quote_count': number % 3}}
+
+
+def synthetic_user(user_id, username=None):
+    return {'id': str(user_id), 'username': username or f"user{user_id}", 'name': f"User {user_id}", 'created_at': '2010-01-01T00:00:00.000Z',
+            'description': 'mock account', 'location': 'localhost', 'verified': False, 'profile_image_url': 'http://localhost/x.png',
+            'public_metrics': {'followers_count': int(user_id) % 1000, 'following_count': 10, 'tweet_count': 100, 'listed_count': 1}}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" #keep-alive, so connection pooling shows up in the numbers
+    disable_nagle_algorithm = True #headers and body go out in separate writes: avoid the delayed-ACK stall on reused connections
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _count(self):
+        with self.server.lock:
+            self.server.calls += 1
+            self.server.remaining = max(0, self.server.remaining - 1)
+            return self.server.calls, self.server.remaining
+
+    def _send_json(self, payload, status=200):
+        calls, remaining = self._count()
+        if self.config.fail_every and calls % self.config.fail_every == 0:
+            status, payload, remaining = 429, {'title': 'Too Many Requests', 'status': 429}, 0
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('x-rate-limit-limit', str(self.config.rate_limit))
+        self.send_header('x-rate-limit-remaining', str(remaining))
+        self.send_header('x-rate-limit-reset', str(int(self.server.reset)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _page(self, query, make, offset=0):
+        token = int((query.get('pagination_token') or query.get('next_token') or ['0'])[0] or 0)
+        size = min(int(query.get('max_results', [self.config.page_size])[0]), self.config.page_size)
+        start = offset + token * size
+        payload = {'data': [make(start + n) for n in range(size)], 'meta': {'result_count': size}}
+        if token + 1 < self.config.pages:
+            payload['meta']['next_token'] = str(token + 1)
+        return payload
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        if url.path.rstrip('/') == '/2/tweets/search/stream':
+            return self._stream()
+        if url.path.rstrip('/') == '/2/tweets/search/stream/rules':
+            rules = list(self.server.rules.values())
+            return self._send_json({'data': rules, 'meta': {'result_count': len(rules)}} if rules else {'meta': {'result_count': 0}})
+        if url.path.rstrip('/') in ('/2/tweets/search/recent', '/2/tweets/search/all'):
+            return self._send_json(self._search(query))
+        if url.path.rstrip('/') == '/2/tweets':
+            ids = query.get('ids', [''])[0].split(',')
+            data = [dict(synthetic_tweet(int(tweet_id) - 10**18)) for tweet_id in ids if tweet_id]
+            users = {tweet['author_id']: synthetic_user(tweet['author_id']) for tweet in data}
+            return self._send_json({'data': data, 'includes': {'users': list(users.values())}})
+        if url.path.rstrip('/') == '/2/users/by':
+            names = query.get('usernames', [''])[0].split(',')
+            return self._send_json({'data': [synthetic_user(2000 + number, name) for number, name in enumerate(names) if name]})
+        if len(parts) == 4 and parts[:2] == ['2', 'users'] and parts[3] == 'tweets':
+            return self._send_json(self._page(query, synthetic_tweet))
+        if len(parts) == 4 and parts[:2] == ['2', 'users'] and parts[3] in ('followers', 'following'):
+            return self._send_json(self._page(query, lambda number: synthetic_user(5000 + number)))
+        self._send_json({'title': 'Not Found', 'status': 404}, status=404)
+
+    def _search(self, query):
+        #Tweets are numbered from start_time (in seconds), so separate time slices get separate tweets
+        start_time = query.get('start_time', [None])[0]
+        offset = int(datetime.fromisoformat(start_time.replace('Z', '+00:00')).timestamp()) % 10**9 if start_time else 0
+        payload = self._page(query, synthetic_tweet, offset)
+        if 'author_id' in query.get('expansions', [''])[0]:
+            users = {tweet['author_id']: synthetic_user(tweet['author_id']) for tweet in payload['data']}
+            payload['includes'] = {'users': list(users.values())}
+        return payload
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if urlparse(self.path).path.rstrip('/') != '/2/tweets/search/stream/rules':
+            return self._send_json({'title': 'Not Found', 'status': 404}, status=404)
+        dry_run = 'dry_run=true' in self.path
+        created = []
+        adds = payload.get('add', [])
+        cap = self.config.max_rules
+        with self.server.lock:
+            over_cap = bool(adds) and cap is not None and len(self.server.rules) + len(adds) > cap
+            existing = len(self.server.rules)
+            for rule in [] if over_cap else adds:
+                self.server.rule_ids += 1
+                rule = dict(rule, id=str(self.server.rule_ids))
+                created.append(rule)
+                if not dry_run:
+                    self.server.rules[rule['id']] = rule
+            deleted = payload.get('delete', {}).get('ids', [])
+            if not dry_run:
+                for rule_id in deleted:
+                    self.server.rules.pop(rule_id, None)
+        if over_cap:
+            return self._send_json({'title': 'RulesCapExceeded', 'type': 'https://api.twitter.com/2/problems/rule-cap', 'status': 403,
+                                    'detail': f"Rule cap exceeded: {existing} rules, {len(adds)} added, {cap} allowed"}, status=403)
+        summary = {'created': len(created), 'deleted': len(deleted), 'valid': len(created), 'invalid': 0}
+        self._send_json({'data': created, 'meta': {'summary': summary}}, status=201 if created else 200)
+
+    def _stream(self):
+        self._count()
+        config = self.config
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        interval = 1.0 / config.stream_rate if config.stream_rate else None
+        last_sent = time.monotonic()
+        sent = 0
+        try:
+            while not self.server.stopping.is_set():
+                if config.stream_total is not None and sent >= config.stream_total:
+                    break
+                if config.disconnect_after is not None and sent >= config.disconnect_after:
+                    self.close_connection = True
+                    self.connection.shutdown(2) #abrupt drop, no closing chunk
+                    return
+                now = time.monotonic()
+                if interval is None or now - last_sent < interval:
+                    if config.heartbeat and now - last_sent >= config.heartbeat:
+                        self._chunk(b'\r\n')
+                        last_sent = now
+                    time.sleep(min(interval or 0.05, 0.05))
+                    continue
+                with self.server.lock:
+                    self.server.streamed += 1
+                    number = self.server.streamed
+                line = json.dumps({'data': {'id': str(10**18 + number), 'text': synthetic_tweet(number)['text']},
+                                   'matching_rules': [{'id': '1', 'tag': None}]}).encode() + b'\r\n'
+                self._chunk(line)
+                sent += 1
+                last_sent += interval
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Mock API on a background thread. Use as a context manager; base_url goes to Transport(base_url=...).
+    """
+    daemon_threads = True
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), MockHandler)
+        self.config = config or MockConfig()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.calls = 0
+        self.streamed = 0
+        self.rules = {}
+        self.rule_ids = 0
+        self.reset = time.time() + self.config.window
+        self.remaining = self.config.rate_limit
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="twifesh-mock-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local mock of the Twitter API v2 for TwiFesh benchmarks")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stream-rate', type=float, default=1000)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-every', type=int, default=None)
+    parser.add_argument('--disconnect-after', type=int, default=None)
+    parser.add_argument('--max-rules', type=int, default=None)
+    args = parser.parse_args()
+    config = MockConfig(stream_rate=args.stream_rate, pages=args.pages, latency=args.latency,
+                        fail_every=args.fail_every, disconnect_after=args.disconnect_after, max_rules=args.max_rules)
+    server = MockServer(config, port=args.port)
+    print(f"Mock Twitter API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
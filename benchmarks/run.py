@@ -0,0 +1,154 @@
+"""
+Benchmarks for TwiFesh against the local mock API (benchmarks/mock_server.py). No network or token needed.
+
+Reports per scenario: throughput, per-call latency percentiles, peak Python memory and CPU time.
+
+    python benchmarks/run.py                       #all scenarios
+    python benchmarks/run.py --only stream --tweets 20000
+    python benchmarks/run.py --no-keepalive        #compare against a new connection per call
+    python benchmarks/run.py --json results.json   #keep the numbers for comparison between commits
+"""
+import os, sys, json, time, argparse, threading, tracemalloc, contextlib
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import MockServer, MockConfig
+from twifesh import Profile, Profiler, Stream
+from utils.transport import Transport
+from utils.cache import TTLCache
+
+
+class TimedTransport(Transport):
+    """
+    Transport that records the latency of every call per endpoint.
+    """
+    def __init__(self, *args, keepalive=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not keepalive:
+            self.session.headers['Connection'] = 'close'
+        self.latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, url, endpoint=endpoint, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[str(endpoint)].append(elapsed)
+        return response
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def measure(name, transport, run):
+    """
+    Run a scenario and collect its numbers. run() returns the number of items processed.
+    """
+    tracemalloc.start()
+    cpu, wall = time.process_time(), time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        items = run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    calls = [latency for latencies in transport.latencies.values() for latency in latencies]
+    return {
+        'scenario': name,
+        'items': items,
+        'seconds': round(wall, 4),
+        'items_per_second': round(items / wall, 1) if wall else None,
+        'calls': len(calls),
+        'p50_ms': round(percentile(calls, 50) * 1000, 3) if calls else None,
+        'p99_ms': round(percentile(calls, 99) * 1000, 3) if calls else None,
+        'peak_memory_kb': round(peak / 1024, 1),
+        'cpu_seconds': round(cpu, 4),
+    }
+
+
+def bench_profile(server, args):
+    transport = TimedTransport('mock-token', base_url=server.base_url, keepalive=not args.no_keepalive)
+    def run():
+        for number in range(args.calls):
+            #A fresh cache each time so every call reaches the API
+            Profile('mock-token', f"user{number}", transport=transport, cache=TTLCache()).get_profile()
+        return args.calls
+    return measure('profile', transport, run)
+
+
+def bench_profile_tweets(server, args):
+    transport = TimedTransport('mock-token', base_url=server.base_url, keepalive=not args.no_keepalive)
+    return measure('profiler_tweets', transport, lambda: len(Profiler('mock-token', 'someone', transport=transport).get_profile_tweets()))
+
+
+def bench_followers(server, args):
+    transport = TimedTransport('mock-token', base_url=server.base_url, keepalive=not args.no_keepalive)
+    return measure('profiler_followers', transport, lambda: sum(1 for _ in Profiler('mock-token', 'someone', transport=transport).iter_followers()))
+
+
+def bench_stream(server, args):
+    transport = TimedTransport('mock-token', base_url=server.base_url, keepalive=not args.no_keepalive)
+    server.config.stream_total = args.tweets
+    stream = Stream('mock-token', keywords=['benchmark'], full_details=True, transport=transport)
+    def run():
+        reader = threading.Thread(target=stream.get_stream, daemon=True)
+        reader.start()
+        deadline = time.monotonic() + 60 + args.tweets / args.stream_rate
+        while stream.hydration_stats['received'] + stream.hydration_stats['dropped'] < args.tweets and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stream.stop()
+        reader.join()
+        stream.hydrator.stop(drain=True)
+        return stream.hydration_stats['hydrated']
+    result = measure('stream_full_details', transport, run)
+    result['hydration'] = stream.hydration_stats
+    result['connection'] = stream.stream_stats
+    return result
+
+
+SCENARIOS = {
+    'profile': bench_profile,
+    'profiler_tweets': bench_profile_tweets,
+    'profiler_followers': bench_followers,
+    'stream': bench_stream,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', choices=list(SCENARIOS), action='append', help="run only these scenarios")
+    parser.add_argument('--calls', type=int, default=200, help="profile lookups in the profile scenario")
+    parser.add_argument('--pages', type=int, default=20, help="pages served by paginated endpoints")
+    parser.add_argument('--tweets', type=int, default=5000, help="tweets sent on the stream")
+    parser.add_argument('--stream-rate', type=float, default=5000, help="tweets per second on the stream")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds of simulated network latency per call")
+    parser.add_argument('--fail-every', type=int, default=None, help="answer 429 to every n-th call")
+    parser.add_argument('--no-keepalive', action='store_true', help="open a new connection for every call")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.only or SCENARIOS:
+        config = MockConfig(stream_rate=args.stream_rate, heartbeat=0, pages=args.pages, latency=args.latency,
+                            fail_every=args.fail_every, rate_limit=10**9)
+        with MockServer(config) as server:
+            results.append(SCENARIOS[name](server, args))
+
+    columns = ['scenario', 'items', 'seconds', 'items_per_second', 'calls', 'p50_ms', 'p99_ms', 'peak_memory_kb', 'cpu_seconds']
+    print(' | '.join(columns))
+    for result in results:
+        print(' | '.join(str(result.get(column)) for column in columns))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
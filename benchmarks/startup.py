@@ -0,0 +1,92 @@
+"""
+Cold start benchmark: what a short-lived collector (cron job, container, notebook cell) pays before its first API call.
+
+Reports, each as the median over --runs fresh interpreters:
+- python -c pass                  the interpreter alone, the floor
+- import twifesh                  importing the library
+- python -m twifesh --help        the command line interface up to argument parsing
+- import + first collector        import twifesh and build a Profiler (the first one builds the HTTP transport)
+and, in this process, the cost of building further Profile/Profiler objects that share a transport.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --importtime    #also list the slowest modules from python -X importtime
+    python benchmarks/startup.py --json startup.json       #keep the numbers for comparison between commits
+"""
+import os, sys, json, time, argparse, statistics, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    'python -c pass': ['-c', 'pass'],
+    'import twifesh': ['-c', 'import twifesh'],
+    'python -m twifesh --help': ['-m', 'twifesh', '--help'],
+    'import + first collector': ['-c', "import twifesh; twifesh.Profiler('token', 'username')"],
+}
+
+
+def time_command(arguments, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return {'median_ms': statistics.median(times) * 1000, 'min_ms': min(times) * 1000}
+
+
+def time_construction(count):
+    sys.path.insert(0, ROOT)
+    from twifesh import Profile, Profiler
+    from utils.transport import Transport
+    transport = Transport('token')
+    start = time.perf_counter()
+    for number in range(count):
+        Profiler('token', f'user{number}', transport=transport)
+        Profile('token', f'user{number}', transport=transport)
+    return (time.perf_counter() - start) / (2 * count) * 1e6
+
+
+def slowest_imports(top):
+    """
+    Modules with the highest cumulative import time under python -X importtime.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import twifesh'], cwd=ROOT, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        modules.append((int(parts[1]), parts[2].strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help="fresh interpreters per command")
+    parser.add_argument('--objects', type=int, default=10000, help="Profile/Profiler objects built in the construction test")
+    parser.add_argument('--importtime', action='store_true', help="list the slowest modules imported by twifesh")
+    parser.add_argument('--top', type=int, default=15, help="modules listed with --importtime")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'command':<28}{'median ms':>12}{'min ms':>10}")
+    for name, arguments in COMMANDS.items():
+        results[name] = time_command(arguments, args.runs)
+        print(f"{name:<28}{results[name]['median_ms']:>12.1f}{results[name]['min_ms']:>10.1f}")
+    results['construction_us'] = time_construction(args.objects)
+    print(f"\nProfile/Profiler construction with a shared transport: {results['construction_us']:.1f} us per object")
+
+    if args.importtime:
+        results['slowest_imports'] = slowest_imports(args.top)
+        print(f"\n{'cumulative ms':>14}  module")
+        for microseconds, module in results['slowest_imports']:
+            print(f"{microseconds / 1000:>14.1f}  {module}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
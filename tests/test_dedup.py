@@ -0,0 +1,29 @@
+from utils.dedup import DedupIndex
+from utils.checkpoint import Checkpoint
+
+
+def test_dedup_index_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'seen.sqlite')
+    index = DedupIndex(path, capacity=10000, recent=10)
+    assert all(index.add(str(10**18 + number)) for number in range(100))
+    assert not index.add(str(10**18 + 5))
+    index.close()
+
+    index = DedupIndex(path, capacity=10000, recent=10)
+    assert str(10**18 + 5) in index
+    assert not index.add(str(10**18 + 99))
+    assert index.add(str(10**18 + 100))
+    assert str(10**18 + 1000) not in index
+    index.close()
+
+
+def test_checkpoint_resumes_from_the_saved_file(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = Checkpoint(path, save_interval=60)
+    checkpoint.update('stream', last_id='7')
+    checkpoint.update('stream', last_seen_at='2022-07-10T12:34:56.000Z')
+    assert Checkpoint(path).get('stream') == {'last_id': '7'} #the second update waits for save_interval
+    checkpoint.save()
+    assert Checkpoint(path).get('stream') == {'last_id': '7', 'last_seen_at': '2022-07-10T12:34:56.000Z'}
+    checkpoint.clear('stream')
+    assert Checkpoint(path).get('stream') is None
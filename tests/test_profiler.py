@@ -0,0 +1,29 @@
+from mock_server import MockServer, MockConfig
+from twifesh import Profiler
+from utils.checkpoint import Checkpoint
+from utils.dedup import DedupIndex
+from utils.records import record_id
+from utils.transport import Transport
+
+
+def test_resumed_timeline_loses_no_tweet(tmp_path):
+    with MockServer(MockConfig(pages=5, page_size=10)) as server:
+        transport = Transport('token', base_url=server.base_url)
+        checkpoint, dedup = Checkpoint(str(tmp_path / 'checkpoint.json'), save_interval=0), DedupIndex()
+        first = []
+        tweets = Profiler('token', 'someone', transport=transport, checkpoint=checkpoint, dedup=dedup).iter_profile_tweets()
+        for tweet in tweets:
+            first.append(record_id(tweet))
+            if len(first) == 24:
+                break
+        tweets.close() #the run stops part way through the third page
+        assert checkpoint.get('profiler:someone:tweets')['pagination_token']
+
+        resumed = Profiler('token', 'someone', transport=transport, checkpoint=Checkpoint(checkpoint.path), dedup=dedup)
+        rest = [record_id(tweet) for tweet in resumed.iter_profile_tweets()]
+        assert len(set(first) | set(rest)) == 50
+        assert len(first) + len(rest) <= 51 #at most the tweet in hand when the first run stopped comes again
+        assert not set(first[:-1]) & set(rest)
+
+        again = Profiler('token', 'someone', transport=transport, checkpoint=Checkpoint(checkpoint.path), dedup=dedup)
+        assert list(again.iter_profile_tweets()) == []
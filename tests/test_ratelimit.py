@@ -0,0 +1,41 @@
+import time
+from types import SimpleNamespace
+from pytest import approx
+from utils.ratelimit import RateLimiter
+
+
+def response(limit, remaining, reset, status_code=200):
+    headers = {'x-rate-limit-limit': str(limit), 'x-rate-limit-remaining': str(remaining), 'x-rate-limit-reset': str(reset)}
+    return SimpleNamespace(headers=headers, status_code=status_code)
+
+
+def test_unknown_endpoint_goes_straight_out():
+    assert RateLimiter().try_acquire('tweets') == 0
+
+
+def test_calls_are_paced_once_the_reserve_is_reached():
+    limiter = RateLimiter(reserve=0.1)
+    reset = int(time.time()) + 100
+    limiter.update('tweets', response(100, 12, reset))
+    assert limiter.try_acquire('tweets') == 0
+    assert limiter.try_acquire('tweets') == 0 #12 then 11 left: above the reserve of 10
+    assert limiter.try_acquire('tweets') == 0 #10 left: spread over the window from now on
+    spacing = (reset - time.time()) / 10
+    assert limiter.try_acquire('tweets') == approx(spacing, abs=0.5)
+    assert limiter.status()['tweets']['remaining'] == 9
+
+
+def test_spent_budget_waits_for_the_reset():
+    limiter = RateLimiter()
+    reset = int(time.time()) + 50
+    limiter.update('tweets', response(100, 3, reset, status_code=429))
+    assert limiter.try_acquire('tweets') == approx(reset - time.time() + 1, abs=0.5)
+    assert limiter.wait_time('tweets') == approx(reset - time.time(), abs=0.5)
+    assert limiter.try_acquire('users') == 0 #other endpoints keep their own budget
+
+
+def test_expired_window_is_forgotten():
+    limiter = RateLimiter()
+    limiter.update('tweets', response(100, 0, int(time.time()) - 1))
+    assert limiter.try_acquire('tweets') == 0
+    assert limiter.status() == {}
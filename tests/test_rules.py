@@ -0,0 +1,44 @@
+import pytest
+from mock_server import MockServer, MockConfig
+from utils.helpers import RulesException
+from utils.rules import RuleManager
+from utils.transport import Transport
+
+
+@pytest.fixture
+def manager():
+    with MockServer(MockConfig(max_rules=5)) as server:
+        yield RuleManager(Transport('token', base_url=server.base_url), max_rules=5)
+
+
+def values(manager):
+    return sorted(rule['value'] for rule in manager.current())
+
+
+def test_diff_keeps_unchanged_rules_and_drops_duplicates(manager):
+    current = [{'id': '1', 'value': 'a', 'tag': 't'}, {'id': '2', 'value': 'b'}, {'id': '3', 'value': 'a', 'tag': 't'}]
+    to_add, to_delete = manager.diff([{'value': 'a', 'tag': 't'}, {'value': 'c', 'tag': None}], current)
+    assert to_add == [{'value': 'c'}]
+    assert sorted(rule['id'] for rule in to_delete) == ['1', '2'] #one of the two 'a' rules is kept
+
+
+def test_sync_replaces_rules_at_the_cap(manager):
+    manager.add([{'value': f"old{number}"} for number in range(5)])
+    desired = [{'value': value, 'tag': None} for value in ('old0', 'new1', 'new2', 'new3')]
+    assert manager.sync(desired) == {'added': 3, 'deleted': 4, 'kept': 1}
+    assert values(manager) == ['new1', 'new2', 'new3', 'old0']
+
+
+def test_sync_over_the_cap(manager):
+    manager.add([{'value': f"old{number}"} for number in range(4)])
+    with pytest.raises(RulesException):
+        manager.sync([{'value': 'new1'}, {'value': 'new2'}], prune=False)
+    with pytest.raises(RulesException):
+        manager.sync([{'value': f"new{number}"} for number in range(6)])
+    assert values(manager) == ['old0', 'old1', 'old2', 'old3']
+
+
+def test_dry_run_at_the_cap_changes_nothing(manager):
+    manager.add([{'value': f"old{number}"} for number in range(5)])
+    assert manager.sync([{'value': 'new1'}, {'value': 'new2'}], dry_run=True) == {'added': 2, 'deleted': 5, 'kept': 0}
+    assert values(manager) == ['old0', 'old1', 'old2', 'old3', 'old4']
@@ -0,0 +1,20 @@
+import unicodedata
+from utils.text import TextCleaner, clean_tweet
+
+
+def test_default_is_ascii_only():
+    assert clean_tweet("Hello, wörld! https://t.co/x #tag @user") == "Hello w rld tag user"
+
+
+def test_keep_unicode_keeps_combining_marks():
+    cleaner = TextCleaner(keep_unicode=True)
+    assert cleaner("नमस्ते दुनिया!") == "नमस्ते दुनिया "
+    assert cleaner("مَرْحَبًا") == "مَرْحَبًا"
+    decomposed = unicodedata.normalize('NFD', "école")
+    assert cleaner(decomposed) == decomposed
+
+
+def test_keep_unicode_still_splits_on_underscores_and_emoji():
+    cleaner = TextCleaner(keep_unicode=True)
+    assert cleaner("snake_case ❤️ ok") == "snake case ok"
+    assert TextCleaner(keep_unicode=True, strip_emoji=False)("love ❤️ it") == "love ❤️ it"
@@ -15,114 +15,204 @@ Contributors: Prince Analyst
 ##Script will run till an error is encountered in the stream or it is stopped with "Ctrl+C" twice.
 ##############################################################################################################################
 
-import requests, json, re, time
-from datetime import datetime as dt
+if __name__ == '__main__':
+    #python twifesh.py <command> / python -m twifesh <command>: see utils/cli.py
+    from utils.cli import main
+    raise SystemExit(main())
+
+import json, time, logging, threading
+from datetime import datetime as dt, timezone, timedelta
 from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from utils.helpers import (BadRequest, RulesException, StreamException, Url)
+from utils.hydrator import Hydrator
+from utils.backoff import network_backoff, http_backoff, rate_limit_backoff
+from utils.writer import JsonlWriter
+from utils.sinks import Dispatcher, StdoutSink, FileSink
+from utils.export import ParquetExporter
+from utils.cache import TTLCache
+from utils.text import default_cleaner
+from utils.fields import default_fields, LOOKUP, PROFILE, TIMELINE, FOLLOWERS
+from utils.rules import RuleManager, join_keywords
+from utils.records import record_id, record_time, TweetRecord, TimelineTweet, UserSummary, tweet_payload, flatten_metrics
+from utils.logs import configure_logging
+from utils import metrics
+
+logger = logging.getLogger('twifesh')
 
 class FeshBuilder:
-    def __init__(self, bearer_token):
+    cleaner = default_cleaner
+
+    def __init__(self, bearer_token, transport=None, cache=None, fields=None, compact=False):
+        """
+        transport: a utils.transport.Transport to share one connection pool between instances.
+        One is created if not supplied.
+        cache: a utils.cache.TTLCache for username, profile and tweet lookups. Share one between instances
+        (optionally with a SQLiteBackend) to reuse lookups across jobs and restarts. An in-memory one is created if not supplied.
+        fields: a utils.fields.Fields selecting which tweet/user/place fields and expansions the API returns.
+        Each call keeps its usual fields for whatever is not selected
+        compact: return utils.records objects (TweetRecord, TimelineTweet, UserSummary) instead of dicts.
+        They read like the dicts but wrap the API's objects, flattening nested ones and cleaning text only when accessed
+        """
         self.bearer_token = bearer_token
-        self.time_obj_str = dt.strftime(dt.now(), '%Y%B%d_%H_%M_%ms') #This will form part of our filename
+        if transport is None:
+            from utils.transport import Transport #imports requests: only once a collector is built
+            transport = Transport(bearer_token)
+        self.transport = transport
+        self.cache = cache if cache is not None else TTLCache()
+        self.fields = fields if fields is not None else default_fields
+        self.compact = compact
+        self._time_obj_str = None
+
+    @property
+    def time_obj_str(self):
+        """
+        Start time that forms part of output filenames. Taken the first time a filename needs it, not for every instance.
+        """
+        if self._time_obj_str is None:
+            self._time_obj_str = dt.strftime(dt.now(), '%Y%B%d_%H_%M_%ms')
+        return self._time_obj_str
+
+    @time_obj_str.setter
+    def time_obj_str(self, value):
+        self._time_obj_str = value
 
     def bearer_oauth(self, header):
         """
         Method required by bearer token authentication.
+        Kept for callers using requests directly: the shared transport already sends these headers.
         """
         header.headers["Authorization"] = f"Bearer {self.bearer_token}"
         header.headers["User-Agent"] = "TwiFeshStreamerTitterAPIv2"
         return header
 
+    def _get(self, url, endpoint, **kwargs):
+        """
+        GET that waits out rate limits: after a 429 the transport's rate limiter holds the retry until the window resets,
+        so jobs sharing a transport queue up behind the limit instead of failing.
+        """
+        while True:
+            response = self.transport.get(url, endpoint=endpoint, **kwargs)
+            if response.status_code != 429:
+                return response
+            wait = self.transport.rate_limiter.wait_time(endpoint)
+            logger.warning(f"Rate limit reached on {metrics.endpoint_label(endpoint)}, retrying in {wait:.0f} seconds",
+                           extra={'event': 'rate_limited', 'endpoint': metrics.endpoint_label(endpoint), 'wait': round(wait, 1)})
+
     def clean_tweet(self, tweet):
-        tweet = re.sub(r"http\S+", "", tweet)
-        tweet = re.sub(r"https\S+", "", tweet)
-        tweet = re.sub('[^A-Za-z0-9]+', ' ', tweet)
-        return tweet
+        """
+        Clean a tweet's text with self.cleaner. Set cleaner to a utils.text.TextCleaner with other options
+        (e.g. keep_unicode=True) to change how cleaned_tweet is produced.
+        """
+        return self.cleaner.clean(tweet)
 
     def get_tweet_details(self, tweet_id):
         """
         Get the full detail of a tweet by tweet id string
         """
+        status, details = self.get_tweets_details([tweet_id])
+        if not status:
+            return status, details
+        if not details:
+            return False, f"error fetching full tweet details: => no data returned for {tweet_id}"
+        return True, details[0]
+
+    def get_tweets_details(self, tweet_ids, cache=True):
+        """
+        Get the full detail of up to 100 tweets in a single lookup.
+        - Returns (True, list of payloads) in the order the API returned them, each author matched back by author_id
+        - Returns (False, message) on failure, same messages as get_tweet_details
+        Tweets found in the cache are not looked up again.
+        cache: False to neither read nor fill the cache, for tweets seen once (stream hydration): every new tweet
+        would otherwise evict a username/profile entry, and cost a write with a SQLiteBackend
+        """
+        clean = self.clean_tweet
+        cached = [self.cache.get('tweet', self.fields.cache_key(tweet_id, LOOKUP)) if cache else None for tweet_id in tweet_ids]
+        missing = [tweet_id for tweet_id, raw in zip(tweet_ids, cached) if not raw or 'data' not in raw]
+        found = [self._build_payload(raw['data'], raw['author'], clean) for raw in cached if raw and 'data' in raw]
+        if not missing:
+            return True, found
         try:
-            a_tweet = requests.get(
-                Url.tweets.value, 
-                params=
-                {   'ids':tweet_id, 
-                    'user.fields':'created_at,description,entities,id,location,name,pinned_tweet_id,profile_image_url,protected,public_metrics,url,username,verified,withheld',
-                    'place.fields':'contained_within,country,country_code,full_name,geo,id,name,place_type', 
-                    'tweet.fields':'source,created_at,geo',
-                    'expansions': 'referenced_tweets.id.author_id'}, auth=self.bearer_oauth
-                )
+            params = self.fields.params(LOOKUP)
+            params['ids'] = ','.join(missing)
+            a_tweet = self.transport.get(Url.tweets.value, endpoint=Url.tweets, params=params)
+            json_response = a_tweet.json()
             if a_tweet.status_code != 200:
-                json_response = json.loads(a_tweet.text)
                 status = json_response.get('status')
                 if status and status == 429:
                     return False, f"{status}: rate limit reached"
-            data = json.loads(a_tweet.text)['data'][0]
-            includes = json.loads(a_tweet.text)['includes']['users'][0]
-            #print(f"data => {data}\nincludes => {includes}")
-            
-            payloader = {
-                            'tweet_id' : data.get('id'),
-                            'created_at' : data.get('created_at'),
-                            'tweet_author_id' : data.get('author_id'),
-                            'tweet_author_description' : includes.get('description'),
-                            'tweet_author_username' : includes.get('username'),
-                            'tweet_author_location' : includes.get('location'),
-                            'tweet_author_image' : includes.get('profile_image_url'),
-                            'tweet_author_join_date': includes.get('created_at'),
-                            'tweet_author_following_count': includes.get('public_metrics').get('following_count'),
-                            'tweet_author_followers_count': includes.get('public_metrics').get('followers_count'),
-                            'tweet_author_total_tweets':includes.get('public_metrics').get('tweet_count'),
-                            'tweet_author_verified': includes.get('public_metrics').get('verified'),
-                            'tweet_author_name': includes.get('public_metrics').get('name'),
-                            'tweet' : data.get('text'),
-                            'cleaned_tweet' : self.clean_tweet(data.get('text')),
-                            'source' : data.get('source'),
-                            'quoted_id': None,
-                            'in_reply_to_id': None
-                        }
-            if data.get('referenced_tweets'):
-                try:
-                    payloader['quoted_id'] = ','.join([line['id'] for line in data.get('referenced_tweets') if line['type'] == 'quoted'])
-                except:
-                    pass
-                try:
-                    payloader['in_reply_to_id'] = ','.join([line['id'] for line in data.get('referenced_tweets') if line['type'] == 'replied_to'])
-                except:
-                    pass
-            return True, payloader            
+            users = {user.get('id'): user for user in json_response.get('includes', {}).get('users', [])}
+            for data in json_response.get('data') or []: #only 'errors' when every tweet was deleted or made protected
+                author = users.get(data.get('author_id'), {})
+                #The cache keeps the API's objects, so cached tweets can be served as dicts or compact records alike
+                if cache:
+                    self.cache.set('tweet', self.fields.cache_key(data.get('id'), LOOKUP), {'data': data, 'author': author})
+                found.append(self._build_payload(data, author, clean))
+            return True, found
         except Exception as e:
             message = f"error fetching full tweet details: => {e}"
             return False, message
 
+    def _build_payload(self, data, author, clean=None):
+        clean = clean or self.clean_tweet
+        if self.compact:
+            return TweetRecord(data, author, clean)
+        return tweet_payload(data, author, clean)
+
 class Profile(FeshBuilder):
-    def __init__(self, bearer_token, usernames):
+    max_usernames = 100 #usernames per /2/users/by call
+
+    def __init__(self, bearer_token, usernames, transport=None, cache=None, fields=None):
         """
         username: string with profile names seperated by commas and no spaces. eg: "profile1,profile2"
+        fields: a utils.fields.Fields, only its user fields apply. Profiles are returned as the API's own objects
         """
-        super().__init__(bearer_token)
+        super().__init__(bearer_token, transport, cache, fields)
         self.usernames = usernames
 
 
     def get_profile(self):
-        params = {
-            "user.fields":"description,created_at,pinned_tweet_id,location,verified,profile_image_url,public_metrics",
-            "usernames": self.usernames}
+        """
+        Profiles found in the cache come first, the rest are looked up 100 names per call (the API limit).
+        """
+        result = deque() #optimized for collection of data. works like list but faster
+        missing = []
+        usernames = self.usernames
+        if isinstance(usernames, (list, tuple)):
+            usernames = ','.join(usernames)
+        for username in usernames.split(','):
+            if not username.strip():
+                continue
+            profile = self.cache.get('user', self.fields.cache_key(username.strip().lower(), PROFILE))
+            if profile is None:
+                missing.append(username.strip())
+            else:
+                result.append(profile)
+
+        for start in range(0, len(missing), self.max_usernames):
+            if not self._fetch_profiles(missing[start:start + self.max_usernames], result):
+                return None
+        return result
+
+    def _fetch_profiles(self, usernames, result):
+        params = self.fields.params(PROFILE)
+        params["usernames"] = ','.join(usernames)
         url = Url.profile.value
         
         try:
-            response = requests.request("GET", url, auth=self.bearer_oauth, params=params)
+            response = self._get(url, Url.profile, params=params)
             if response.status_code != 200:
                 raise BadRequest(f"Request returned an error: {response.status_code} { response.text}")
             json_response = response.json()
-            result = deque() #optimized for collection of data. works like list but faster
             try:
                 #Success with profile(s) match found
                 data = json_response.get('data')
                 errors = json_response.get('errors')
                 if data:
-
+                    for profile in data:
+                        self.cache.set('user', self.fields.cache_key(profile['username'].lower(), PROFILE), profile)
+                        self.cache.set('user_id', profile['username'].lower(), profile['id'])
                     result.extend(data)
                 if errors:
                     for item in errors:
@@ -133,30 +223,41 @@ class Profile(FeshBuilder):
                 if data:
                     for item in data:
                         result.append(item['detail'])
-            return result
+            return True
         except Exception as e:
-            print(f"Error fetching profile(s) url: {e}")
-            return None
+            logger.error(f"Error fetching profile(s) url: {e}", extra={'event': 'profile_error', 'usernames': len(usernames)})
+            return False
         
 
 class Profiler(FeshBuilder):
     """
     Get all the tweets from a tweeter user
     """
-    def __init__(self, bearer_token, username):
+    def __init__(self, bearer_token, username, transport=None, cache=None, fields=None, compact=False, checkpoint=None, dedup=None):
         """
         username: string with the profile name/handle
+        fields, compact: see FeshBuilder. compact records are TimelineTweet and UserSummary
+        checkpoint: a utils.checkpoint.Checkpoint. A run that stopped part way (an error, an iterator left unfinished) resumes from the page it was on,
+        and a timeline collected to the end is continued with since_id: only newer tweets are fetched
+        dedup: a utils.dedup.DedupIndex. Timeline tweets already in it are skipped
         """
-        super().__init__(bearer_token)
+        super().__init__(bearer_token, transport, cache, fields, compact)
         self.usernames = username
+        self.cursor = None #pagination_token of the page being consumed by the iter_* methods
+        self.checkpoint = checkpoint
+        self.dedup = dedup
 
     def get_profile_id(self):
-        twifesh=Profile(self.bearer_token, self.usernames)
+        user_id = self.cache.get('user_id', self.usernames.lower())
+        if user_id:
+            return user_id
+        twifesh=Profile(self.bearer_token, self.usernames, transport=self.transport, cache=self.cache)
         speaker = twifesh.get_profile()
         if speaker:
             try:
                 user_id = speaker[0].get('id')
                 if user_id:
+                    self.cache.set('user_id', self.usernames.lower(), user_id)
                     return user_id
             except AttributeError:
                 if 'Could not find user with usernames' in speaker[0]:
@@ -164,110 +265,355 @@ class Profiler(FeshBuilder):
         return None
 
     def _mini_clean(self, data, profiles=False, tweets=False):
-        this_page = deque()
-        for line in data:
-            public_metrics = line.get('public_metrics')
-            del line['public_metrics']
-            if tweets:
-                line['retweet_count'] = public_metrics.get('retweet_count', 'no data')
-                line['reply_count'] = public_metrics.get('reply_count', 'no data')
-                line['like_count'] = public_metrics.get('like_count', 'no data')
-                line['quote_count'] = public_metrics.get('quote_count', 'no data')
-            elif profiles:
-                line['followers_count'] = public_metrics.get('followers_count', 'no data')
-                line['following_count'] = public_metrics.get('following_count', 'no data')
-                line['tweet_count'] = public_metrics.get('tweet_count', 'no data')
-                line['listed_count'] = public_metrics.get('listed_count', 'no data')
-            this_page.append(line)
-        return this_page
-
-    def get_profile_tweets(self):
-        """
-        Get first page of response
         """
+        Flatten each record's public_metrics into top level counts (left out if public_metrics was not requested).
+        """
+        record_type = TimelineTweet if tweets else UserSummary
+        if self.compact:
+            return deque(map(record_type, data))
+        return deque(flatten_metrics(line, record_type.counts) for line in data)
+
+    def _find_user_id(self):
         user_id = self.get_profile_id()
         if not user_id:
-            print(f"We could not find a Twitter user with the username: '{self.usernames}'")
-            return None
-        tweets = []
-        page = 1
-        url = f"{Url.user.value}/{user_id}/tweets"
-        params = {"tweet.fields": "created_at,public_metrics", "max_results":100}
-        
-        response = requests.request("GET", url, auth=self.bearer_oauth, params=params)
+            logger.warning(f"We could not find a Twitter user with the username: '{self.usernames}'", extra={'event': 'user_not_found', 'username': self.usernames})
+        return user_id
+
+    def _fetch_page(self, url, params, endpoint, pagination_token=None):
+        params = dict(params)
+        if pagination_token:
+            params['pagination_token'] = pagination_token
+        response = self._get(url, endpoint, params=params)
         if response.status_code != 200:
             raise BadRequest(f"Request returned an error: {response.status_code} {response.text}")
+        return response.json()
+
+    def _iter_pages(self, url, params, endpoint, pagination_token=None, max_pages=None, prefetch=True):
+        """
+        Yield the raw 'data' of each page, one page at a time.
+        - With prefetch the next page is requested in the background while the current one is being consumed
+        - self.cursor holds the pagination_token of the page being consumed: pass it back as pagination_token
+          to resume from that page. It is None once the last page has been consumed
+        """
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        def fetch(token):
+            if executor:
+                return executor.submit(self._fetch_page, url, params, endpoint, token)
+            return self._fetch_page(url, params, endpoint, token)
+
+        token = pagination_token
+        pending = fetch(token)
+        page = 0
+        try:
+            while pending is not None:
+                json_response = pending.result() if executor else pending
+                page += 1
+                next_token = (json_response.get('meta') or {}).get('next_token')
+                pending = None
+                if next_token and (max_pages is None or page < max_pages):
+                    pending = fetch(next_token)
+                self.cursor = token
+                yield json_response.get('data') or []
+                token = next_token
+            self.cursor = token if max_pages is not None and page >= max_pages else None
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _tweet_pages(self, user_id, since_id=None, **kwargs):
+        url = f"{Url.user.value}/{user_id}/tweets"
+        params = self.fields.params(TIMELINE)
+        params["max_results"] = 100
+        if since_id:
+            params["since_id"] = since_id
+        return self._iter_pages(url, params, (Url.user, 'tweets'), **kwargs)
+
+    def _timeline(self, user_id, pagination_token=None, max_pages=None, prefetch=True, mark_pages=True, resume=True):
+        """
+        Timeline pages with checkpointing and deduplication applied.
+        Tweets already in the dedup index are left out. A page's ids go into the index once the caller asks for the next page,
+        so a page that was not fully consumed is fetched again on resume with nothing skipped.
+        mark_pages=False: the caller adds each id itself as it hands the record on (see iter_profile_tweets)
+        resume: see _checkpointed
+        """
+        pages = self._checkpointed('tweets', lambda **kwargs: self._tweet_pages(user_id, **kwargs), pagination_token, max_pages, prefetch,
+                                   timeline=True, resume=resume)
+        for data in pages:
+            if self.dedup is not None:
+                data = [line for line in data if line.get('id') not in self.dedup]
+            yield data
+            if mark_pages and self.dedup is not None:
+                for line in data:
+                    self.dedup.add(line.get('id'))
+
+    def _checkpointed(self, kind, make_pages, pagination_token, max_pages, prefetch, timeline=False, resume=True):
+        """
+        Pages from make_pages(**options), keeping the run's resume point in self.checkpoint under 'profiler:<username>:<kind>':
+        - pagination_token: the page being consumed, fetched again on resume. Cleared when the run ends normally, at the last page
+          or at max_pages, so only a run that stopped early (an error, an abandoned generator) resumes
+        - resume=False: always start at the first page and keep no resume point. For the get_* methods, whose earlier pages are
+          lost with the failed call: resuming would skip them
+        - timelines: since_id, the newest tweet of the last complete run, bounds the next run to newer tweets
+        """
+        if self.checkpoint is None:
+            yield from make_pages(pagination_token=pagination_token, max_pages=max_pages, prefetch=prefetch)
+            return
+        key = f"profiler:{self.usernames.lower()}:{kind}"
+        state = self.checkpoint.get(key, {})
+        if not resume:
+            state['pagination_token'] = None
+        if pagination_token is None:
+            pagination_token = state.get('pagination_token')
+        if not pagination_token:
+            #A new run: newer than what the last complete run saw
+            state.update(run_since_id=state.get('since_id'), newest_id=None)
+        options = {'pagination_token': pagination_token, 'max_pages': max_pages, 'prefetch': prefetch}
+        if timeline:
+            options['since_id'] = state.get('run_since_id')
+        newest = state.get('newest_id')
+        completed = False
+        try:
+            for data in make_pages(**options):
+                if timeline and data:
+                    ids = [int(line['id']) for line in data if line.get('id')] + ([int(newest)] if newest else [])
+                    newest = str(max(ids)) if ids else newest
+                self.checkpoint.update(key, pagination_token=self.cursor if resume else None, run_since_id=state.get('run_since_id'), newest_id=newest)
+                yield data
+            completed = True
+        finally:
+            if completed:
+                done = {'pagination_token': None, 'run_since_id': None, 'newest_id': None}
+                if timeline:
+                    known = [int(value) for value in (newest, state.get('run_since_id'), state.get('since_id')) if value]
+                    done['since_id'] = str(max(known)) if known else None
+                self.checkpoint.update(key, **done)
+            self.checkpoint.save()
+
+    def _user_pages(self, user_id, target, **kwargs):
+        url = f"{Url.user.value}/{user_id}/{target}"
+        params = self.fields.params(FOLLOWERS)
+        params['max_results'] = 250
+        return self._iter_pages(url, params, (Url.user, target), **kwargs)
+
+    def iter_profile_tweets(self, pages=False, pagination_token=None, max_pages=None, prefetch=True):
+        """
+        Lazily yield the user's tweets, same records as get_profile_tweets.
+        - pages: yield each page as a deque of records instead of single records
+        - pagination_token: resume from a previous self.cursor
+        - max_pages: stop after this many pages
+        """
+        user_id = self._find_user_id()
+        if not user_id:
+            return
+        for data in self._timeline(user_id, pagination_token=pagination_token, max_pages=max_pages, prefetch=prefetch, mark_pages=pages):
+            records = self._mini_clean(data, tweets=True)
+            if pages:
+                yield records
+                continue
+            for record in records:
+                yield record
+                if self.dedup is not None:
+                    self.dedup.add(record.get('id')) #delivered: a resume skips it
+
+    def iter_followers(self, pages=False, pagination_token=None, max_pages=None, prefetch=True):
+        """
+        Lazily yield the user's followers, same records as get_followers_following. See iter_profile_tweets for the options.
+        """
+        return self._iter_users('followers', pages, pagination_token, max_pages, prefetch)
+
+    def iter_following(self, pages=False, pagination_token=None, max_pages=None, prefetch=True):
+        """
+        Lazily yield the accounts the user follows, same records as get_followers_following(target='following').
+        """
+        return self._iter_users('following', pages, pagination_token, max_pages, prefetch)
+
+    def _iter_users(self, target, pages, pagination_token, max_pages, prefetch):
+        user_id = self._find_user_id()
+        if not user_id:
+            return
+        make_pages = lambda **kwargs: self._user_pages(user_id, target, **kwargs)
+        for data in self._checkpointed(target, make_pages, pagination_token, max_pages, prefetch):
+            records = self._mini_clean(data, profiles=True)
+            if pages:
+                yield records
+            else:
+                yield from records
+
+    def get_profile_tweets(self, export_path=None):
+        """
+        Get all the tweets of the user, page after page
+        - export_path: write the pages to this Parquet file as they arrive instead of returning a list (needs pyarrow).
+          The path is returned. With a checkpoint, an existing file is kept and a new part is written next to it
+        With a checkpoint a call always starts at the newest tweet, and stops at the since_id of the last complete call.
+        To resume part way after an error, use iter_profile_tweets
+        """
+        user_id = self._find_user_id()
+        if not user_id:
+            return None
+        tweets = []
+        exporter = self._exporter(export_path, 'tweets')
+        try:
+            for page, data in enumerate(self._timeline(user_id, resume=False), start=1):
+                if data:
+                    self._collect(data, tweets, exporter, tweets=True)
+                logger.debug(f'page {page}', extra={'event': 'page', 'page': page, 'records': len(data), 'username': self.usernames})
+        finally:
+            if exporter:
+                exporter.close()
         
-        json_response = response.json()
-        data = json_response.get('data')
-        if data:
-            mini_cleaned = self._mini_clean(data, tweets=True)
-            tweets.extend(mini_cleaned)
-        next_page = json_response.get('meta').get('next_token')
-        while next_page:
-            print(f'page {page}')
-            page += 1
-            params['pagination_token'] = next_page
-            response = requests.request("GET", url, auth=self.bearer_oauth, params=params)
-            json_response = response.json()
-            data = json_response.get('data')
-            if data:
-                mini_cleaned = self._mini_clean(data, tweets=True)
-                tweets.extend(mini_cleaned)
-            next_page = json_response.get('meta').get('next_token')
-        
+        if exporter:
+            return exporter.path
         return tweets
 
-    def get_followers_following(self, pages=1, target='followers'):
+    def _exporter(self, export_path, kind):
+        if not export_path:
+            return None
+        #With a checkpoint, later runs (since_id follow-ups) export next to the earlier files instead of over them
+        return ParquetExporter(export_path, kind, overwrite=self.checkpoint is None)
+
+    def _collect(self, data, results, exporter=None, profiles=False, tweets=False):
+        """
+        Keep a page: written straight to the exporter if there is one, otherwise cleaned into results.
+        """
+        if exporter:
+            exporter.write_page(data)
+        else:
+            results.extend(self._mini_clean(data, profiles=profiles, tweets=tweets))
+
+    def get_followers_following(self, pages=1, target='followers', export_path=None):
         """
         Get the followers of a user/profileby username/handle or who they are following
         - user_id of user to find their followers
         - pages will take a maximum of 20: each page is 250 results. 1k max retrievals to stay within bounds(?)
+        - export_path: write the pages to this Parquet file as they arrive instead of returning a list (needs pyarrow).
+          The path is returned. With a checkpoint, an existing file is kept and a new part is written next to it
+        Always starts at the first page: to resume part way after an error, use iter_followers / iter_following
         """
         if pages > 20:
             pages = 20
-        user_id = self.get_profile_id()
+        user_id = self._find_user_id()
         if not user_id:
-            print(f"We could not find a Twitter user with the username: '{self.usernames}'")
             return None
 
-        url = f"https://api.twitter.com/2/users/{user_id}/followers"
-        if target.lower().strip() == 'following':
-            url = f"https://api.twitter.com/2/users/{user_id}/following"
-
-        params = {'user.fields':'created_at,public_metrics,location,verified', 'max_results':250}
-        page = 1
-        response = requests.get(url, auth=self.bearer_oauth, params=params)
-        json_response =  json.loads(response.text)
-        user_data = json_response['data']
+        target = 'following' if target.lower().strip() == 'following' else 'followers'
         followers = []
-        
-        if user_data:
-            mini_cleaned = self._mini_clean(user_data, profiles=True)
-            followers.extend(mini_cleaned)
-            print(f"page {page}")
-            next_page = json_response.get('meta').get('next_token')
-            while next_page:
-                if page == pages: #stop at the end of the requested number of pages. Max will be 20
-                    break
-                page += 1
-                params['pagination_token'] = next_page
-                response = requests.get(url, auth=self.bearer_oauth, params=params)
-                json_response = response.json()
-                user_data = json_response.get('data')
+        exporter = self._exporter(export_path, 'users')
+        try:
+            make_pages = lambda **kwargs: self._user_pages(user_id, target, **kwargs)
+            for page, user_data in enumerate(self._checkpointed(target, make_pages, None, pages, True, resume=False), start=1):
                 if user_data:
-                    mini_cleaned = self._mini_clean(user_data, profiles=True)
-                    followers.extend(mini_cleaned)
-                    print(f'page {page}')
-                next_page = json_response.get('meta').get('next_token')
+                    self._collect(user_data, followers, exporter, profiles=True)
+                    logger.debug(f'page {page}', extra={'event': 'page', 'page': page, 'records': len(user_data), 'username': self.usernames})
+        finally:
+            if exporter:
+                exporter.close()
                 
+        if exporter:
+            return exporter.path
         return followers
 
 
 
+class BulkProfiler(FeshBuilder):
+    """
+    Run Profiler jobs for many users at once on a thread pool
+    """
+    def __init__(self, bearer_token, usernames, max_workers=8, transport=None, cache=None, fields=None, compact=False, checkpoint=None, dedup=None):
+        """
+        usernames: list of profile names/handles, or a string of them seperated by commas
+        max_workers: users processed at the same time. They all share one connection pool, cache and rate limit budget
+        fields, compact, checkpoint, dedup: passed on to every Profiler, see Profiler
+        """
+        super().__init__(bearer_token, transport, cache, fields, compact)
+        self.checkpoint = checkpoint
+        self.dedup = dedup
+        if isinstance(usernames, str):
+            usernames = usernames.split(',')
+        self.usernames = [username.strip() for username in usernames if username.strip()]
+        self.max_workers = max_workers
+        self.errors = {} #username -> exception of the last run
+
+    def get_profiles(self):
+        """
+        Profiles of all the users, looked up 100 at a time. Also primes the username -> id cache for the Profiler jobs.
+        """
+        return Profile(self.bearer_token, self.usernames, transport=self.transport, cache=self.cache, fields=self.fields).get_profile()
+
+    def run(self, method, *args, **kwargs):
+        """
+        Call a Profiler method for every user concurrently.
+        - Returns {username: result}. A user whose job raised is left out and its exception kept in self.errors,
+          so one failure does not stop the others
+        - An export_path containing '{username}' is formatted per user, e.g. export_path='{username}_tweets.parquet'
+        """
+        self.get_profiles()
+        self.errors = {}
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jobs = {executor.submit(self._run_one, username, method, args, kwargs): username for username in self.usernames}
+            for job in as_completed(jobs):
+                username = jobs[job]
+                try:
+                    results[username] = job.result()
+                except Exception as e:
+                    logger.error(f"Profiling '{username}' failed: {e}", extra={'event': 'profiling_failed', 'username': username})
+                    self.errors[username] = e
+        return results
+
+    def _run_one(self, username, method, args, kwargs):
+        if isinstance(kwargs.get('export_path'), str):
+            kwargs = dict(kwargs, export_path=kwargs['export_path'].format(username=username))
+        profiler = Profiler(self.bearer_token, username, transport=self.transport, cache=self.cache, fields=self.fields, compact=self.compact,
+                            checkpoint=self.checkpoint, dedup=self.dedup)
+        return getattr(profiler, method)(*args, **kwargs)
+
+    def get_profile_tweets(self, **kwargs):
+        """
+        {username: tweets} for every user. Same options as Profiler.get_profile_tweets
+        """
+        return self.run('get_profile_tweets', **kwargs)
+
+    def get_followers_following(self, pages=1, target='followers', **kwargs):
+        """
+        {username: followers or following} for every user. Same options as Profiler.get_followers_following
+        """
+        return self.run('get_followers_following', pages=pages, target=target, **kwargs)
+
+
 class Stream(FeshBuilder):
-    def __init__(self, bearer_token, keywords=None, full_details=False, write_file=False):
-        super().__init__(bearer_token)
+    def __init__(self, bearer_token, keywords=None, full_details=False, write_file=False, batch_size=100, flush_interval=1.0, workers=2, max_queue=10000, transport=None, writer=None, cache=None, heartbeat_timeout=30, max_attempts=None, sinks=None, sink_queue=10000, processes=None, process_hook=None, ordered=False, fields=None, compact=False, rule_tag=None, rule_manager=None, dedup=None, checkpoint=None):
+        """
+        full_details: hydrate each streamed tweet. Lookups are batched in the background:
+        - batch_size: tweet ids per lookup (max 100)
+        - flush_interval: max seconds a tweet waits for its batch to fill up
+        - workers: number of hydration threads
+        - max_queue: tweets waiting for hydration before new ones are dropped. See hydration_stats
+        writer: a utils.writer.JsonlWriter to control buffering, rotation and compression of the output file.
+        With write_file=True and no writer, a default one writes to <keywords><time>.json
+        sinks: where tweets go, a list of utils.sinks.Sink (StdoutSink, FileSink, CallbackSink, QueueSink, SQLiteSink, S3Sink).
+        Defaults to printing to stdout, plus the output file with write_file=True. Each sink runs on its own thread
+        with a queue of sink_queue records, so a slow sink cannot hold up the stream. See sink_stats
+        processes: parse, hydrate and post-process tweets in this many worker processes; the connection thread only reads bytes.
+        - process_hook: picklable function run on every tweet in the workers, returns the tweet to keep (changed or not) or None to drop it
+        - ordered: deliver tweets to the sinks in stream order
+        See pipeline_stats. The repeated-tweet check is not made in this mode, lines are not parsed on the reader
+        heartbeat_timeout: seconds without any data, heartbeats included (sent every 20s), before the connection is treated as dead
+        max_attempts: consecutive failed connection attempts before giving up. None keeps trying forever
+        fields, compact: field selection and record type of the hydrated tweets, see FeshBuilder
+        rule_tag: tag of the rules made from the keywords
+        rule_manager: a utils.rules.RuleManager, to set the rule length and count limits of your access level
+        dedup: a utils.dedup.DedupIndex. Tweets already in it (replays after a reconnect, tweets written before a restart) are skipped.
+        Ids go into it when their record is handed to the sinks, so a tweet dropped before that (hydration falling behind,
+        a failed lookup, still queued at close) is not taken for a duplicate later. Replays of recently delivered tweets are
+        skipped on the reader, before hydration; the rest on delivery
+        checkpoint: a utils.checkpoint.Checkpoint keeping the last delivered tweet's id and created_at under 'stream',
+        and when the oldest tweet received but never delivered arrived. See backfill
+        """
+        super().__init__(bearer_token, transport, cache, fields, compact)
+        self.rule_tag = rule_tag
+        self.rule_manager = rule_manager if rule_manager is not None else RuleManager(self.transport)
+        self.dedup = dedup
+        self.checkpoint = checkpoint
         self.write_file = False
         if write_file:
             self.write_file = write_file
@@ -275,21 +621,89 @@ class Stream(FeshBuilder):
         if not self.keywords:
             self.keywords = []
         self.full_details = full_details
-        self.attempts = 1
-        self.expo_time = 2
-        self.broken = False
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.backoff = {'network': network_backoff(), 'http': http_backoff(), 'rate_limit': rate_limit_backoff()}
+        self.connection_stats = {'connects': 0, 'reconnects': 0, 'heartbeats': 0, 'tweets': 0, 'duplicates': 0, 'uptime': 0.0, 'connected_since': None, 'last_error': None}
+        self._response = None
+        self._delivered = False
+        self._stopping = threading.Event()
+        self.processes = processes
+        self.process_hook = process_hook
+        self.ordered = ordered
+        self.pipeline = None
+        self.hydrator = None
+        if self.full_details and not processes:
+            self.hydrator = Hydrator(partial(self.get_tweets_details, cache=False), self._on_hydrated, batch_size=batch_size, 
+                                     flush_interval=flush_interval, workers=workers, max_queue=max_queue)
+        self.writer = writer
+        self.sinks = sinks
+        self.sink_queue = sink_queue
+        self.dispatcher = None
+        self._gauges = [] #(queue label, depth function) published to metrics.queue_depth
+
+    @property
+    def stream_stats(self):
+        """
+        Connection report: connects, reconnects, heartbeats seen, tweets read, duplicates skipped, tweets per second of uptime,
+        total uptime in seconds and the last error.
+        """
+        stats = dict(self.connection_stats)
+        if stats['connected_since'] is not None:
+            stats['uptime'] += time.monotonic() - stats['connected_since']
+        stats['tweets_per_second'] = stats['tweets'] / stats['uptime'] if stats['uptime'] else 0.0
+        return stats
+
+    @property
+    def sink_stats(self):
+        """
+        Per sink: records queued, written, dropped because the sink fell behind, and failed batches.
+        """
+        if self.dispatcher is None:
+            return None
+        return self.dispatcher.stats
+
+    @property
+    def pipeline_stats(self):
+        """
+        Multi-process mode report: tweets received and dropped, chunks processed and in flight, records delivered, errors.
+        """
+        if self.pipeline is None:
+            return None
+        return self.pipeline.stats
+
+    @property
+    def hydration_stats(self):
+        """
+        Backpressure report of the hydration stage: queue depth, dropped/late/missing tweets, batches issued.
+        """
+        if self.hydrator is None:
+            return None
+        return self.hydrator.stats
+
+    def _on_hydrated(self, status, tweet_details):
+        """
+        Called from the hydration workers for every hydrated tweet or failed batch.
+        """
+        if status:
+            self._deliver(tweet_details)
+        else:
+            if 'rate limit reached' in tweet_details:
+                wait = self.transport.rate_limiter.wait_time(Url.tweets)
+                logger.warning(f"{tweet_details}. Hydration resumes in {wait:.0f} seconds, when the limit window resets. Tweets are queued meanwhile",
+                               extra={'event': 'hydration_rate_limited', 'wait': round(wait, 1), **self.hydration_stats})
+            elif tweet_details.startswith('error'):
+                logger.error(tweet_details, extra={'event': 'hydration_error'})
 
     def get_rules(self):
-        response = requests.get(
-            Url.rules.value, auth=self.bearer_oauth
-        )
+        response = self.transport.get(Url.rules.value, endpoint=Url.rules)
         if response.status_code != 200:
             raise RulesException(f"Cannot get rules (HTTP {response.status_code}): {response.text}")
 
         try:
-            print(f"Last keyword(s) streamed are: => {[line['value'] for line in response.json()['data']][::-1]}")
+            logger.info(f"Last keyword(s) streamed are: => {[line['value'] for line in response.json()['data']][::-1]}", extra={'event': 'rules'})
         except KeyError:
-            print(f"The last streaming attempt failed. No keywords in play before now.")
+            logger.info(f"The last streaming attempt failed. No keywords in play before now.", extra={'event': 'rules'})
             return None
         return response.json()
 
@@ -304,141 +718,523 @@ class Stream(FeshBuilder):
 
         ids = list(map(lambda rule: rule["id"], rules["data"]))
         payload = {"delete": {"ids": ids}}
-        response = requests.post(
-            Url.rules.value,
-            auth=self.bearer_oauth,
-            json=payload
-        )
+        response = self.transport.post(Url.rules.value, json=payload, endpoint=Url.rules)
         if response.status_code != 200:
             raise RulesException(f"Cannot delete rules (HTTP {response.status_code}): {response.text}")
 
-        print('Old rule(s) successfully cleared!')
+        logger.info('Old rule(s) successfully cleared!', extra={'event': 'rules_deleted', 'rules': len(ids)})
         return True
 
 
     def set_rules(self):
         """
-        This uses feedback from the user to get and set the new rule(s)
+        This uses feedback from the user to get and set the new rule(s).
+        Keywords are packed into as few rules as the rule length allows (see sync_rules).
         """
-        keywords_array = []
-
         if not self.keywords:
-            attempts = 0
-            print("What are we streaming for? If there are more than one topic, seperate them with commas.\n\
-            PS: Maximum topics we can stream is 5.\n")
-            my_rules = input(">>> ")
-            while not my_rules:
-                if attempts == 3:
-                    print("Please restart the module.")
-                    raise SystemExit
-                attempts += 1
-                print(f"We need a keyword or an array of keywords, max 5. Please try again: {attempts}/3")
-                print("Please enter a keyword to stream...")
-                my_rules = input(">>> ")
-            
-            
-            for word in my_rules.split(',')[:5]:
-                keeper_dict = {"value": word.strip()}
-                keywords_array.append(keeper_dict)
-                self.keywords.append(word.strip())
-        else:
-            for word in self.keywords:
-                keeper_dict = {"value": word.strip()}
-                keywords_array.append(keeper_dict) 
-        
-        payload = {"add": keywords_array}
-        response = requests.post(
-            Url.rules.value ,
-            auth=self.bearer_oauth,
-            json=payload,
-        )
-        if response.status_code != 201:
-            raise RulesException(f"Cannot add rules (HTTP {response.status_code}): {response.text}")
-
-        print(f"Rule(s) successfully set for keywords {[line for line in self.keywords][:5]}.")
+            self._ask_keywords()
+
+        rules = self.rule_manager.keyword_rules(self.keywords, self.rule_tag)
+        self.rule_manager.add([{key: value for key, value in rule.items() if value} for rule in rules])
+        logger.info(f"Rule(s) successfully set for keywords {self.keywords}.", extra={'event': 'rules_set', 'rules': len(rules)})
         return True
 
+    def _ask_keywords(self):
+        attempts = 0
+        print("What are we streaming for? If there are more than one topic, seperate them with commas.\n")
+        my_rules = input(">>> ")
+        while not my_rules.strip(' ,'):
+            if attempts == 3:
+                print("Please restart the module.")
+                raise SystemExit
+            attempts += 1
+            print(f"We need a keyword or an array of keywords. Please try again: {attempts}/3")
+            print("Please enter a keyword to stream...")
+            my_rules = input(">>> ")
+        self.keywords.extend(word.strip() for word in my_rules.split(',') if word.strip())
+
+    def sync_rules(self, dry_run=False):
+        """
+        Make the server's rules match the keywords, applying only the difference: unchanged rules stay,
+        so a restart does not drop tweets while the rules are deleted and re-added.
+        dry_run: validate the change with the API without applying it.
+        Returns {'added', 'deleted', 'kept'} counts.
+        """
+        return self.rule_manager.sync(self.rule_manager.keyword_rules(self.keywords, self.rule_tag), dry_run=dry_run)
+
+    def update_rules(self, keywords, dry_run=False):
+        """
+        Stream other keywords from now on. Safe while get_stream is running: the open connection
+        picks up the new rules without reconnecting.
+        """
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        keywords = [keyword.strip() for keyword in keywords if keyword.strip()]
+        summary = self.rule_manager.sync(self.rule_manager.keyword_rules(keywords, self.rule_tag), dry_run=dry_run)
+        if not dry_run:
+            self.keywords = keywords
+        return summary
+
     def get_stream(self):
-        repetition_breaker = None #Twitter will return same tweet if rate limit is reached but app is restarted. If this is value is same as last tweet, treat is as limit reached and sleep 15
-        
-        response = requests.get(Url.stream.value , auth=self.bearer_oauth, stream=True)
+        """
+        Connect to the stream and keep it up until stop() is called, max_attempts is reached or an unrecoverable error.
+        Disconnects are retried in a loop with jittered back-off: separate policies for network errors, HTTP errors and 429.
+        """
+        self._stopping.clear()
+        if self.dispatcher is None:
+            self.dispatcher = Dispatcher(self._default_sinks(), max_queue=self.sink_queue).start()
+        if self.hydrator is not None:
+            self.hydrator.start()
+        if self.processes and self.pipeline is None:
+            from utils.workers import ProcessPipeline
+            self.pipeline = ProcessPipeline(self.processes, self._deliver, self.bearer_token, full_details=self.full_details,
+                                            hook=self.process_hook, ordered=self.ordered, base_url=self.transport.base_url,
+                                            cleaner=self.cleaner if self.cleaner is not default_cleaner else None,
+                                            fields=self.fields, compact=self.compact)
+            self.pipeline.start()
+        self._watch_queues()
+
+        failures = 0
+        while not self._stopping.is_set():
+            if self.max_attempts is not None and failures >= self.max_attempts:
+                logger.error(f"We could not reconnect the stream after {failures} attempts. Exiting...", extra={'event': 'stream_gave_up', 'attempts': failures})
+                raise SystemExit
+            self._delivered = False
+            policy = self._connect_and_consume()
+            if self._delivered:
+                failures = 0 #the connection was healthy before it dropped
+            if policy is None or self._stopping.is_set():
+                continue
+            failures += 1
+            wait = self.backoff[policy].next()
+            self.connection_stats['reconnects'] += 1
+            metrics.stream_reconnects.inc(policy=policy)
+            logger.warning(f"Stream disconnected ({self.connection_stats['last_error']}). Reconnecting in {wait:.2f} seconds, attempt {failures} ...",
+                           extra={'event': 'stream_disconnected', 'policy': policy, 'wait': round(wait, 2), 'attempt': failures})
+            self._stopping.wait(wait)
+
+    def _watch_queues(self):
+        """
+        Expose the depth of the hydration, sink and pipeline queues as twifesh_queue_depth gauges.
+        """
+        self._gauges = []
+        if self.hydrator is not None:
+            self._gauges.append(('hydration', self.hydrator.queue.qsize))
+        if self.pipeline is not None:
+            pipeline = self.pipeline
+            self._gauges.append(('pipeline', lambda: pipeline.stats['in_flight']))
+        dispatcher = self.dispatcher
+        for name in dispatcher.stats:
+            self._gauges.append((f"sink:{name}", lambda name=name: dispatcher.stats[name]['queued']))
+        for queue, depth in self._gauges:
+            metrics.queue_depth.set_function(depth, queue=queue)
+
+    def _connect_and_consume(self):
+        """
+        One connection from connect to disconnect.
+        Returns the back-off policy to apply before reconnecting, or None to reconnect straight away.
+        """
+        from utils.transport import NETWORK_ERRORS
+        try:
+            response = self.transport.get(Url.stream.value, stream=True, endpoint=Url.stream, timeout=(10, self.heartbeat_timeout))
+        except NETWORK_ERRORS as e:
+            self.connection_stats['last_error'] = f"network error: {e}"
+            return 'network'
         if response.status_code != 200:
-            raise StreamException(f"Cannot get stream (HTTP {response.status_code}): {response.text}")
-        print(f"Connection to stream successful! status: {response.status_code} \nListening ...")
+            self.connection_stats['last_error'] = f"HTTP {response.status_code}: {response.text}"
+            response.close()
+            if response.status_code == 429:
+                return 'rate_limit'
+            if response.status_code in (400, 401, 403, 404):
+                #Bad token, bad rules or no access: reconnecting will not help
+                raise StreamException(f"Cannot get stream (HTTP {response.status_code}): {response.text}")
+            return 'http'
+
+        logger.info(f"Connection to stream successful! status: {response.status_code}. Listening ...", extra={'event': 'stream_connected', 'status': response.status_code})
+        self._response = response
+        self.connection_stats['connects'] += 1
+        self.connection_stats['connected_since'] = time.monotonic()
+        try:
+            return self._consume(response)
+        except NETWORK_ERRORS as e:
+            #Includes the read timeout: nothing, not even a heartbeat, within heartbeat_timeout
+            self.connection_stats['last_error'] = f"network error: {e}"
+            return 'network'
+        except Exception:
+            if self._stopping.is_set():
+                return None #the response was closed under the reader by stop()
+            raise
+        finally:
+            response.close()
+            self._response = None
+            self.connection_stats['uptime'] += time.monotonic() - self.connection_stats['connected_since']
+            self.connection_stats['connected_since'] = None
 
+    def _consume(self, response):
+        repetition_breaker = None #Twitter will return same tweet if rate limit is reached but app is restarted. If this is value is same as last tweet, treat is as limit reached
         for response_line in response.iter_lines():
-            if response_line:
-                #Reset exponential timer and attemps count in case they have been used at a stream drop
-                if self.attempts > 1:
-                    self.attempts = 1
-                if self.expo_time > 2:
-                    self.expo_time = 2
-                    
-                tweet_details = json.loads(response_line)
-                if self.full_details:
-                    #fetch the full tweet details
-                    tweet_id = tweet_details['data']['id']
-                    status, tweet_details = self.get_tweet_details(tweet_id)
-                    if self.write_file:
-                        if tweet_details:
-                            if 'rate limit reached' not in tweet_details:
-                                with open('_'.join(self.keywords) +self.time_obj_str + ".json", "a") as file:
-                                    data = json.dumps(tweet_details)
-                                    file.write(data + '\n')
-                    #Check for repeat tweets.
-                    if status:
-                        print(tweet_details, '\n')
-                        if repetition_breaker == tweet_details:
-                            print(f"Same exact tweet returned. We suspect a possinble limit issue.\nResetting connection to the stream after 60 seconds...")
-                            response.close()
-                            print(f"Sleep started @ {dt.now().time()}\n")
-                            time.sleep(60*1)
-                            if self.attempts < 5:
-                                self.attempts = 1
-                                self.get_stream()
-                            else:
-                                print(f"We could not restablish the stream after {self.attempts} trials.")
-                                raise SystemExit
-                        self.attempts = 1
-                        repetition_breaker = tweet_details
-                    else:
-                        if 'rate limit reached' in tweet_details:
-                            print(f"{tweet_details}\nWe will sleep for 15 minutes.")
-                            print(f"Sleep started @ {dt.now().time()}")
-                            time.sleep(60*16)
-                        elif tweet_details.startswith('error'):
-                            print(tweet_details)
-
-                else:
-                    continue #No tweet was recieved for the tweet_id. Ignore
+            if self._stopping.is_set():
+                return None
+            if not response_line:
+                self.connection_stats['heartbeats'] += 1 #keep-alive '\r\n', sent every 20 seconds
+                continue
+            metrics.response_bytes.inc(len(response_line) + 2, endpoint='stream')
+            if not self._delivered:
+                #Data is flowing: start the back-off policies afresh for the next disconnect
+                self._delivered = True
+                for backoff in self.backoff.values():
+                    backoff.reset()
+
+            if self.pipeline is not None:
+                self._count_tweet()
+                self.pipeline.submit(response_line) #parsing and everything after happens in the workers
+                continue
+            tweet_details = json.loads(response_line)
+            if 'data' not in tweet_details:
+                #Error or operational message sent in the stream, e.g. a forced disconnect notice
+                logger.warning(f"Stream message: {tweet_details}", extra={'event': 'stream_message'})
+                continue
+            self._count_tweet()
+            tweet_id = tweet_details['data']['id']
+            if self.full_details:
+                #Check for repeat tweets.
+                if repetition_breaker == tweet_id:
+                    logger.warning(f"Same exact tweet returned. We suspect a possinble limit issue. Resetting connection to the stream ...", extra={'event': 'stream_repeat', 'tweet_id': tweet_id})
+                    self.connection_stats['last_error'] = "repeated tweet, suspected rate limit"
+                    return 'rate_limit'
+                repetition_breaker = tweet_id
+            if self.dedup is not None and self.dedup.seen_recently(tweet_id):
+                self.connection_stats['duplicates'] += 1 #replay of a tweet delivered moments ago
+                continue
+            if self.full_details:
+                #fetch the full tweet details in the background, in batches
+                if not self.hydrator.submit(tweet_details['data']):
+                    dropped = self.hydrator.stats['dropped']
+                    if dropped == 1 or dropped % 1000 == 0:
+                        logger.warning(f"Hydration is falling behind, {dropped} tweet(s) dropped so far", extra={'event': 'hydration_dropped', **self.hydration_stats})
             else:
-                response.close()
-                print(f"We received an empty byte data: Stream disconnected.\nStarting exponential back-off.\nSleep started @ {dt.now()}")
-                print(f"Sleep: {self.expo_time} seconds ...\n")
-                time.sleep(self.expo_time)
-                self.expo_time *= 2
-                self.attempts += 1
-                if self.expo_time < 60*10:
-                    try:
-                        self.get_stream()
-                    except Exception as e: #Possible ConnectionAbortedError
-                        print(f"An uncaught error occurred: {e}")
-                        raise SystemExit
-                else:
-                    print(f"We could not reconnect the stream after {self.attempts} attempts in the past 10 minutes.\n.Exiting...")
-                        
+                self._deliver(tweet_details)
+
+        self.connection_stats['last_error'] = "stream closed by the server"
+        return 'network'
+
+    def _deliver(self, record):
+        """
+        Hand a record to the sinks, unless it is already in the dedup index. Only now is its id recorded
+        in the index and the checkpoint.
+        """
+        tweet_id = record_id(record) if hasattr(record, 'get') else None
+        dispatcher = self.dispatcher
+        if dispatcher is None:
+            return #closed under a late hydration batch: the hydrator counts it as dropped
+        if tweet_id is not None and self.dedup is not None and not self.dedup.add(tweet_id):
+            self.connection_stats['duplicates'] += 1
+            return
+        dispatcher.dispatch(record)
+        if tweet_id is not None and self.checkpoint is not None:
+            #The tweet's own time: hydration may deliver it well after it arrived, behind tweets still queued
+            self.checkpoint.update('stream', last_id=tweet_id, last_seen_at=record_time(record) or _iso(dt.now(timezone.utc)))
+
+    def _save_lost(self):
+        """
+        Keep the receive time of the oldest tweet this run never delivered (dropped by hydration or the pipeline,
+        failed lookups, still queued at close) under 'stream' -> lost_since, so backfill() starts before it.
+        """
+        times = [stage.lost_since for stage in (self.hydrator, self.pipeline) if stage is not None and stage.lost_since is not None]
+        if not times or self.checkpoint is None:
+            return
+        lost_since = dt.fromtimestamp(min(times), timezone.utc)
+        saved = (self.checkpoint.get('stream') or {}).get('lost_since')
+        if saved is None or lost_since < _utc(saved):
+            self.checkpoint.update('stream', lost_since=_iso(lost_since))
+
+    def backfill(self, **options):
+        """
+        A Search for the tweets missed since the last one in the checkpoint, e.g. while this collector was down,
+        skipping those already in the dedup index. Call run() on it. None if the checkpoint has no tweet yet,
+        or the last one is too recent for the search endpoints.
+        It starts at the oldest tweet the last run received but never delivered (lost_since) when that is earlier.
+        The lost_since mark is cleared once the Search is made: if its run fails, run it again (it keeps its cursors).
+        options are passed to Search (sinks, archive, slices, ...), full_details defaults to the stream's.
+        """
+        state = self.checkpoint.get('stream') if self.checkpoint is not None else None
+        if not state or not state.get('last_seen_at'):
+            return None
+        start = min(_utc(value) for value in (state['last_seen_at'], state.get('lost_since')) if value)
+        if start >= dt.now(timezone.utc) - timedelta(seconds=Search.end_margin):
+            return None
+        options.setdefault('full_details', self.full_details)
+        options.setdefault('seen', self.dedup if self.dedup is not None else set())
+        search = Search(self.bearer_token, self.keywords, start, transport=self.transport, cache=self.cache,
+                        fields=self.fields, compact=self.compact, **options)
+        if state.get('lost_since'):
+            self.checkpoint.update('stream', lost_since=None)
+        return search
+
+    def _count_tweet(self):
+        self.connection_stats['tweets'] += 1
+        metrics.stream_tweets.inc()
+
+    def _default_sinks(self):
+        if self.sinks is not None:
+            return self.sinks
+        sinks = [StdoutSink()]
+        if self.write_file:
+            if self.writer is None:
+                #Keywords may only be known after set_rules, so the default file is named here
+                self.writer = JsonlWriter('_'.join(self.keywords) +self.time_obj_str + ".json")
+            sinks.append(FileSink(self.writer))
+        return sinks
+
+    def stop(self):
+        """
+        Ask a running get_stream to return. Safe to call from another thread.
+        """
+        self._stopping.set()
+        response = self._response
+        if response is not None:
+            response.close() #unblocks a reader waiting for the next line
+
     def stream_now(self):
         """
-        - Initiate steps to stream.
+        - Initiate steps to stream: bring the rules in line with the keywords (asking for them if there are none), then connect.
+        Progress is logged to stderr unless the application has configured logging itself.
+        """
+        if not logger.handlers and not logging.getLogger().handlers:
+            configure_logging()
+        try:
+            if not self.keywords:
+                self._ask_keywords()
+            self.sync_rules()
+            self.get_stream()
+        finally:
+            self.close()
+
+    def close(self, timeout=30):
+        """
+        Deliver whatever is buffered to the sinks, then close them.
+        timeout: seconds to let hydration finish the tweets still queued. The rest are counted as dropped in hydration_stats
+        """
+        if self.hydrator is not None:
+            discarded = self.hydrator.stop(drain=True, timeout=timeout)
+            if discarded:
+                logger.warning(f"{discarded} tweet(s) still waiting for hydration after {timeout} seconds were dropped",
+                               extra={'event': 'hydration_dropped', **self.hydration_stats})
+        if self.pipeline is not None:
+            self.pipeline.stop(timeout=timeout)
+        self._save_lost()
+        self.pipeline = None
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+            self.dispatcher = None
+        for queue, _ in self._gauges:
+            metrics.queue_depth.remove(queue=queue)
+        self._gauges = []
+        if self.dedup is not None:
+            self.dedup.flush()
+        if self.checkpoint is not None:
+            self.checkpoint.save()
+
+
+class Search(FeshBuilder):
+    """
+    Backfill the tweets matching keywords over a time range from the search endpoints, e.g. to fill the gap
+    left by a stream outage. Output goes to sinks in the same records as Stream.
+    """
+    max_query_length = {False: 512, True: 1024}
+    max_page_size = {False: 100, True: 500}
+    recent_days = 7
+    end_margin = 30 #seconds: the API wants end_time at least 10 seconds in the past
+
+    def __init__(self, bearer_token, keywords, start_time, end_time=None, archive=False, slices=8, max_workers=4, max_results=None,
+                 full_details=False, seen=None, sinks=None, write_file=False, writer=None, sink_queue=10000,
+                 transport=None, cache=None, fields=None, compact=False):
+        """
+        keywords: list of keywords (or a comma separated string), searched for as keyword1 OR keyword2 ...
+        start_time / end_time: datetimes (naive ones are UTC) or ISO 8601 strings. end_time defaults to now
+        archive: search the full archive (/2/tweets/search/all, needs Academic Research access) instead of the last 7 days
+        slices: the range is split into this many time slices, paginated in parallel on max_workers threads.
+        Every slice shares the transport's rate limit budget for the endpoint
+        max_results: tweets per page, 100 (recent) or 500 (archive) at most and by default
+        full_details: output the hydrated records of Stream(full_details=True), built from the search results without extra lookups.
+        Otherwise each tweet is output as {'data': tweet}, like the stream's lines
+        seen: set of tweet ids already captured, e.g. utils.writer.read_ids(*stream_output_files). Tweets in it are skipped,
+        and every tweet output is added to it
+        sinks, write_file, writer, sink_queue: as for Stream. The default file is <keywords>_backfill<time>.json
+        """
+        super().__init__(bearer_token, transport, cache, fields, compact)
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        self.keywords = [keyword.strip() for keyword in keywords if keyword.strip()]
+        if not self.keywords:
+            raise ValueError("Search needs at least one keyword")
+        self.archive = archive
+        self.url = Url.search_all if archive else Url.search_recent
+        if len(self.query) > self.max_query_length[archive]:
+            raise ValueError(f"The search query is {len(self.query)} characters long, the limit is {self.max_query_length[archive]}: use fewer keywords")
+        self.start_time, self.end_time = self._time_range(start_time, end_time)
+        self.slices = max(1, slices)
+        self.max_workers = max_workers
+        self.max_results = min(max_results or self.max_page_size[archive], self.max_page_size[archive])
+        self.full_details = full_details
+        self.seen = seen if seen is not None else set()
+        self.sinks = sinks
+        self.write_file = write_file
+        self.writer = writer
+        self.sink_queue = sink_queue
+        self.dispatcher = None
+        self.cursors = {} #slice start -> next_token of the page to fetch next, None once the slice is done
+        self.errors = {} #(slice start, slice end) -> exception
+        self.counters = {'pages': 0, 'tweets': 0, 'duplicates': 0, 'rate_limited': 0, 'slices_done': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def query(self):
+        return join_keywords(self.keywords)
+
+    def _time_range(self, start_time, end_time):
+        now = dt.now(timezone.utc)
+        start = _utc(start_time)
+        end = _utc(end_time) if end_time is not None else now
+        end = min(end, now - timedelta(seconds=self.end_margin))
+        if not self.archive and start < now - timedelta(days=self.recent_days):
+            start = now - timedelta(days=self.recent_days) + timedelta(minutes=1)
+            logger.warning(f"Recent search only covers the last {self.recent_days} days: starting from {start:%Y-%m-%dT%H:%M:%SZ}. Use archive=True for older tweets",
+                           extra={'event': 'search_range_clamped'})
+        if start >= end:
+            raise ValueError(f"start_time {start:%Y-%m-%dT%H:%M:%SZ} is not before end_time {end:%Y-%m-%dT%H:%M:%SZ}")
+        return start.replace(microsecond=0), end.replace(microsecond=0)
+
+    def time_slices(self):
+        """
+        [(start, end)] covering the range in equal slices of whole seconds. end is exclusive, as in the API.
+        """
+        seconds = int((self.end_time - self.start_time).total_seconds())
+        count = max(1, min(self.slices, seconds))
+        bounds = [self.start_time + timedelta(seconds=seconds * number // count) for number in range(count)] + [self.end_time]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @property
+    def stats(self):
+        """
+        Pages fetched, tweets output, duplicates skipped, 429s waited out, slices finished.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+    @property
+    def sink_stats(self):
+        if self.dispatcher is None:
+            return None
+        return self.dispatcher.stats
+
+    def run(self):
+        """
+        Search every time slice, in parallel, and send the tweets to the sinks. The sinks are closed at the end.
+        Slices that failed are in self.errors and can be run again: self.cursors remembers where each one stopped.
+        Returns stats.
         """
-        rules = self.get_rules()
-        if rules:
-            deleted = self.delete_all_rules(rules)
-            if deleted: 
-                result = self.set_rules()
-                if result:
-                    self.get_stream()
+        if self.dispatcher is None:
+            self.dispatcher = Dispatcher(self._default_sinks(), max_queue=self.sink_queue).start()
+        self.errors = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                jobs = {executor.submit(self._run_slice, start, end): (start, end) for start, end in self.time_slices()
+                        if self.cursors.get(start, '') is not None}
+                for job in as_completed(jobs):
+                    start, end = jobs[job]
+                    try:
+                        job.result()
+                    except Exception as e:
+                        logger.error(f"Search slice {start:%Y-%m-%dT%H:%M:%SZ} to {end:%Y-%m-%dT%H:%M:%SZ} failed: {e}",
+                                     extra={'event': 'search_slice_failed'})
+                        self.errors[(start, end)] = e
+        finally:
+            self.close()
+        logger.info(f"Backfill done: {self.stats}", extra={'event': 'search_done', **self.stats})
+        return self.stats
+
+    def _run_slice(self, start, end):
+        if self.full_details:
+            params = self.fields.params(LOOKUP)
         else:
-            result = self.set_rules()
-            if result:
-                self.get_stream()
\ No newline at end of file
+            params = self.fields.params({'tweet.fields': ''})
+        params.update({'query': self.query, 'max_results': self.max_results,
+                       'start_time': f"{start:%Y-%m-%dT%H:%M:%SZ}", 'end_time': f"{end:%Y-%m-%dT%H:%M:%SZ}"})
+        token = self.cursors.get(start)
+        while True:
+            page = self._fetch(params, token)
+            self._deliver(page)
+            token = (page.get('meta') or {}).get('next_token')
+            self.cursors[start] = token
+            if not token:
+                break
+        with self._lock:
+            self.counters['slices_done'] += 1
+
+    def _fetch(self, params, token=None):
+        if token:
+            params = dict(params, next_token=token)
+        while True:
+            response = self.transport.get(self.url.value, params=params, endpoint=self.url)
+            if response.status_code == 429:
+                #The rate limiter has seen the 429 and holds the retry until the window resets
+                with self._lock:
+                    self.counters['rate_limited'] += 1
+                continue
+            if response.status_code != 200:
+                raise BadRequest(f"Request returned an error: {response.status_code} {response.text}")
+            return response.json()
+
+    def _deliver(self, page):
+        users = {user.get('id'): user for user in (page.get('includes') or {}).get('users', [])}
+        fresh = []
+        with self._lock:
+            self.counters['pages'] += 1
+            for tweet in page.get('data') or []:
+                if tweet.get('id') in self.seen:
+                    self.counters['duplicates'] += 1
+                    continue
+                self.seen.add(tweet.get('id'))
+                fresh.append(tweet)
+            self.counters['tweets'] += len(fresh)
+        clean = self.clean_tweet
+        for tweet in fresh:
+            if self.full_details:
+                record = self._build_payload(tweet, users.get(tweet.get('author_id'), {}), clean)
+            else:
+                record = {'data': tweet}
+            self.dispatcher.dispatch(record)
+
+    def _default_sinks(self):
+        if self.sinks is not None:
+            return self.sinks
+        sinks = [StdoutSink()]
+        if self.write_file:
+            if self.writer is None:
+                self.writer = JsonlWriter('_'.join(self.keywords) + '_backfill' + self.time_obj_str + ".json")
+            sinks.append(FileSink(self.writer))
+        return sinks
+
+    def close(self):
+        """
+        Deliver whatever is buffered to the sinks, then close them.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.close()
+            self.dispatcher = None
+
+
+def _iso(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _utc(value):
+    """
+    datetime or ISO 8601 string as an aware UTC datetime. Naive datetimes are taken as UTC.
+    """
+    if isinstance(value, str):
+        value = dt.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
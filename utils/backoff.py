@@ -0,0 +1,52 @@
+import random
+
+
+class Backoff:
+    """
+    Jittered back-off delays for reconnecting.
+    - linear: add `step` each attempt instead of multiplying by `factor`
+    - jitter: fraction of each delay that is randomized, so many clients do not reconnect in lockstep
+    """
+    def __init__(self, initial, maximum, factor=2, step=None, jitter=0.25):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.step = step
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next(self):
+        """
+        Delay before the next attempt, in seconds.
+        """
+        if self.step is not None:
+            delay = self.initial + self.step * self.attempts
+        else:
+            delay = self.initial * self.factor ** self.attempts
+        self.attempts += 1
+        delay = min(delay, self.maximum)
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempts = 0
+
+
+def network_backoff():
+    """
+    TCP/IP level errors: back off linearly by 250ms, up to 16 seconds (Twitter's reconnect guidance).
+    """
+    return Backoff(0.25, 16, step=0.25)
+
+
+def http_backoff():
+    """
+    HTTP errors: back off exponentially from 5 seconds, up to 320 seconds.
+    """
+    return Backoff(5, 320)
+
+
+def rate_limit_backoff():
+    """
+    HTTP 429: back off exponentially from 1 minute, up to 16 minutes.
+    """
+    return Backoff(60, 60*16)
@@ -0,0 +1,131 @@
+import json, time, threading
+from collections import OrderedDict
+from utils import metrics
+
+
+class SQLiteBackend:
+    """
+    On-disk second level for TTLCache, so lookups survive process restarts and can be shared by
+    several collectors on the same machine. Values are stored as JSON.
+    """
+    def __init__(self, path='twifesh_cache.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        import sqlite3
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS cache (kind TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (kind, key))")
+        self._db.commit()
+
+    def get(self, kind, key):
+        """
+        Returns (value, expires) or None if absent or expired.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM cache WHERE kind=? AND key=?", (kind, key)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, kind, key, value, expires):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (kind, key, json.dumps(value), expires))
+            self._db.commit()
+
+    def purge(self):
+        """
+        Drop expired entries.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache with a time to live per kind of entry.
+    - kinds used by TwiFesh: 'user_id' (username -> id), 'user' (username -> profile), 'tweet' (tweet id -> {'data': tweet, 'author': user} as returned by the API)
+      'user' and 'tweet' keys carry a tag of the field selection when it is not the default, see utils.fields.Fields.cache_key
+    - ttls: {kind: seconds}, merged over the defaults
+    - max_size: entries kept in memory across all kinds, least recently used go first
+    - backend: optional persistent second level, e.g. SQLiteBackend(path)
+    - stats: hit/miss counters per kind
+    """
+    default_ttls = {'user_id': 60*60*24*7, 'user': 60*60, 'tweet': 60*60}
+
+    def __init__(self, ttls=None, max_size=10000, backend=None):
+        self.ttls = dict(self.default_ttls)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, kind, outcome):
+        counts = self._stats.setdefault(kind, {'hits': 0, 'misses': 0})
+        counts[outcome] += 1
+        metrics.cache_lookups.inc(kind=kind, outcome='hit' if outcome == 'hits' else 'miss')
+
+    def get(self, kind, key):
+        """
+        Cached value, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end((kind, key))
+                    self._count(kind, 'hits')
+                    return entry[1]
+                del self._entries[(kind, key)]
+        if self.backend is not None:
+            stored = self.backend.get(kind, key)
+            if stored is not None:
+                value, expires = stored
+                with self._lock:
+                    self._store(kind, key, value, expires)
+                    self._count(kind, 'hits')
+                return value
+        with self._lock:
+            self._count(kind, 'misses')
+        return None
+
+    def set(self, kind, key, value):
+        if value is None:
+            return
+        expires = time.time() + self.ttls.get(kind, 60*60)
+        with self._lock:
+            self._store(kind, key, value, expires)
+        if self.backend is not None:
+            self.backend.set(kind, key, value, expires)
+
+    def _store(self, kind, key, value, expires):
+        self._entries[(kind, key)] = (expires, value)
+        self._entries.move_to_end((kind, key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        """
+        {kind: {'hits', 'misses', 'hit_ratio'}} plus the number of entries held in memory.
+        """
+        with self._lock:
+            stats = {kind: dict(counts) for kind, counts in self._stats.items()}
+            size = len(self._entries)
+        for counts in stats.values():
+            total = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = counts['hits'] / total if total else 0.0
+        stats['size'] = size
+        return stats
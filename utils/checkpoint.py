@@ -0,0 +1,58 @@
+import os, json, time, threading
+
+
+class Checkpoint:
+    """
+    Resume points of collectors in one small JSON file: {key: {name: value}}, e.g.
+    'stream' -> last_id, last_seen_at, lost_since and 'profiler:<username>:tweets' -> pagination_token, since_id.
+    - update() changes the values in memory and writes the file at most every save_interval seconds
+    - save() writes now. The file is replaced atomically, so a crash leaves the previous checkpoint intact
+    """
+    def __init__(self, path, save_interval=5.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        self._dirty = False
+        self.state = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def get(self, key, default=None):
+        with self._lock:
+            values = self.state.get(key)
+            return dict(values) if values is not None else default
+
+    def update(self, key, **values):
+        with self._lock:
+            self.state.setdefault(key, {}).update(values)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def clear(self, key=None):
+        """
+        Forget one key's resume point, or all of them.
+        """
+        with self._lock:
+            if key is None:
+                self.state = {}
+            else:
+                self.state.pop(key, None)
+            self._dirty = True
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            temporary = f"{self.path}.tmp"
+            with open(temporary, 'w') as file:
+                json.dump(self.state, file, indent=1)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
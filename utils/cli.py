@@ -0,0 +1,222 @@
+"""
+Command line interface: python -m twifesh <command> (or python twifesh.py <command>).
+
+    python -m twifesh stream python "machine learning" --full-details --output tweets.json
+    python -m twifesh search python --start 2022-07-01T00:00:00 --archive --output backfill.json
+    python -m twifesh profile user1 user2
+    python -m twifesh tweets username --max-pages 5 --export tweets.parquet
+    python -m twifesh followers username --following --max-pages 2
+
+The bearer token is read from --bearer-token or the TWITTER_BEARER_TOKEN environment variable.
+Records are written to stdout as JSON lines unless --output is given.
+Only this module and argparse load at start: each command imports what it needs (requests, the sinks,
+worker processes, pyarrow...) once it runs, so `--help` and short cron jobs start quickly.
+"""
+import os, sys, argparse
+
+
+def _transport(args):
+    if not args.base_url:
+        return None #each collector builds its own
+    from utils.transport import Transport
+    return Transport(args.bearer_token, base_url=args.base_url)
+
+
+def _fields(args):
+    if not args.minimal_fields:
+        return None
+    from utils.fields import Fields
+    return Fields.minimal()
+
+
+def _dedup(args):
+    if not args.dedup:
+        return None
+    from utils.dedup import DedupIndex
+    return DedupIndex(args.dedup)
+
+
+def _checkpoint(args):
+    if not args.checkpoint:
+        return None
+    from utils.checkpoint import Checkpoint
+    return Checkpoint(args.checkpoint)
+
+
+def _output(args):
+    """
+    Where list commands write their JSON lines: the --output file, or stdout.
+    """
+    if args.output:
+        return open(args.output, 'ab')
+    return sys.stdout.buffer
+
+
+def _write(records, args):
+    from utils.writer import dumps
+    output = _output(args)
+    count = 0
+    try:
+        for record in records:
+            output.write(dumps(record))
+            count += 1
+        output.flush()
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return count
+
+
+def _sinks(args):
+    if not args.output:
+        from utils.sinks import StdoutSink
+        return [StdoutSink(json_lines=True)]
+    from utils.writer import JsonlWriter
+    from utils.sinks import FileSink
+    return [FileSink(JsonlWriter(args.output, compression=args.compression))]
+
+
+def stream(args):
+    from twifesh import Stream
+    dedup, checkpoint = _dedup(args), _checkpoint(args)
+    collector = Stream(args.bearer_token, keywords=args.keywords or None, full_details=args.full_details, transport=_transport(args),
+                       max_attempts=args.max_attempts, sinks=_sinks(args), processes=args.processes, fields=_fields(args),
+                       rule_tag=args.rule_tag, dedup=dedup, checkpoint=checkpoint)
+    if args.dry_run:
+        collector.sync_rules(dry_run=True)
+        return 0
+    if args.backfill:
+        search = collector.backfill(sinks=_sinks(args))
+        if search is not None:
+            search.run()
+    try:
+        collector.stream_now()
+    finally:
+        if dedup is not None:
+            dedup.close()
+    return 0
+
+
+def search(args):
+    from twifesh import Search
+    dedup = _dedup(args)
+    collector = Search(args.bearer_token, args.keywords, args.start, end_time=args.end, archive=args.archive, slices=args.slices,
+                       max_workers=args.max_workers, full_details=args.full_details, seen=dedup, sinks=_sinks(args),
+                       transport=_transport(args), fields=_fields(args))
+    try:
+        stats = collector.run()
+    finally:
+        if dedup is not None:
+            dedup.close()
+    print(stats, file=sys.stderr)
+    return 1 if collector.errors else 0
+
+
+def profile(args):
+    from twifesh import Profile
+    collector = Profile(args.bearer_token, args.usernames, transport=_transport(args), fields=_fields(args))
+    _write(collector.get_profile() or [], args)
+    return 0
+
+
+def _profiler(args, dedup=None):
+    from twifesh import Profiler
+    return Profiler(args.bearer_token, args.username, transport=_transport(args), fields=_fields(args),
+                    checkpoint=_checkpoint(args), dedup=dedup)
+
+
+def tweets(args):
+    collector = _profiler(args, _dedup(args))
+    try:
+        if args.export:
+            collector.get_profile_tweets(export_path=args.export)
+        else:
+            _write(collector.iter_profile_tweets(max_pages=args.max_pages), args)
+    finally:
+        if collector.dedup is not None:
+            collector.dedup.close()
+    return 0
+
+
+def followers(args):
+    collector = _profiler(args)
+    target = 'following' if args.following else 'followers'
+    if args.export:
+        collector.get_followers_following(pages=args.max_pages or 20, target=target, export_path=args.export)
+    elif args.following:
+        _write(collector.iter_following(max_pages=args.max_pages), args)
+    else:
+        _write(collector.iter_followers(max_pages=args.max_pages), args)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='twifesh', description="Collect tweets, profiles and followers from the Twitter API v2.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--bearer-token', default=os.environ.get('TWITTER_BEARER_TOKEN'),
+                        help="API bearer token (default: $TWITTER_BEARER_TOKEN)")
+    common.add_argument('--base-url', help="send API calls here instead of api.twitter.com, e.g. the benchmarks/ mock server")
+    common.add_argument('--output', '-o', help="append JSON lines to this file instead of writing them to stdout")
+    common.add_argument('--minimal-fields', action='store_true', help="ask the API for a small set of fields only (Fields.minimal())")
+    common.add_argument('--log-level', default='INFO', help="DEBUG, INFO, WARNING or ERROR")
+    common.add_argument('--json-logs', action='store_true', help="log JSON lines to stderr")
+    common.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this port")
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    command = commands.add_parser('stream', parents=[common], help="stream tweets matching keywords")
+    command.add_argument('keywords', nargs='*', help="keywords to stream (asked for when none are given)")
+    command.add_argument('--full-details', action='store_true', help="hydrate tweets with their author's details")
+    command.add_argument('--processes', type=int, help="parse and hydrate in this many worker processes")
+    command.add_argument('--max-attempts', type=int, help="failed connection attempts in a row before giving up")
+    command.add_argument('--compression', choices=['gzip', 'zstd'], help="compress the --output file")
+    command.add_argument('--rule-tag', help="tag of the rules made from the keywords")
+    command.add_argument('--dry-run', action='store_true', help="only validate the rule changes with the API")
+    command.add_argument('--dedup', help="dedup index path: skip tweets already collected")
+    command.add_argument('--checkpoint', help="checkpoint file keeping the last tweet seen")
+    command.add_argument('--backfill', action='store_true', help="search for the tweets missed since the checkpoint before streaming")
+    command.set_defaults(run=stream)
+
+    command = commands.add_parser('search', parents=[common], help="backfill keywords over a time range")
+    command.add_argument('keywords', nargs='+')
+    command.add_argument('--start', required=True, help="ISO 8601 start time (UTC)")
+    command.add_argument('--end', help="ISO 8601 end time (UTC), default now")
+    command.add_argument('--archive', action='store_true', help="search the full archive (Academic Research access)")
+    command.add_argument('--slices', type=int, default=8)
+    command.add_argument('--max-workers', type=int, default=4)
+    command.add_argument('--full-details', action='store_true')
+    command.add_argument('--compression', choices=['gzip', 'zstd'], help="compress the --output file")
+    command.add_argument('--dedup', help="dedup index path: skip tweets already collected")
+    command.set_defaults(run=search)
+
+    command = commands.add_parser('profile', parents=[common], help="profiles of one or more users")
+    command.add_argument('usernames', nargs='+')
+    command.set_defaults(run=profile)
+
+    for name, run, help in (('tweets', tweets, "a user's timeline"), ('followers', followers, "a user's followers (or following)")):
+        command = commands.add_parser(name, parents=[common], help=help)
+        command.add_argument('username')
+        command.add_argument('--max-pages', type=int, help="stop after this many pages")
+        command.add_argument('--export', help="write to this Parquet file instead (needs pyarrow)")
+        command.add_argument('--checkpoint', help="checkpoint file: resume where the last run stopped")
+        command.set_defaults(run=run)
+        if name == 'tweets':
+            command.add_argument('--dedup', help="dedup index path: skip tweets already collected")
+    command.add_argument('--following', action='store_true', help="the accounts the user follows instead")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.bearer_token:
+        print("twifesh: a bearer token is needed: pass --bearer-token or set TWITTER_BEARER_TOKEN", file=sys.stderr)
+        return 2
+    import logging
+    from utils.logs import configure_logging
+    configure_logging(getattr(logging, args.log_level.upper(), logging.INFO), json_lines=args.json_logs)
+    if args.metrics_port:
+        from utils.metrics import serve_metrics
+        serve_metrics(args.metrics_port)
+    try:
+        return args.run(args)
+    except KeyboardInterrupt:
+        return 130
@@ -0,0 +1,171 @@
+import os, math, struct, hashlib, threading
+from collections import OrderedDict
+
+
+class BloomFilter:
+    """
+    Fixed size set of keys that never misses a key it holds and wrongly claims one it does not hold at about error_rate
+    once `capacity` keys are in. Memory: about 1.8 MB per million keys at error_rate=0.001.
+    """
+    _header = struct.Struct('<QQQ') #size in bits, hashes, keys added
+
+    def __init__(self, capacity=2000000, error_rate=0.001, size=None, hashes=None):
+        self.size = size or max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + number * step) % self.size for number in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def save(self, path):
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(self._header.pack(self.size, self.hashes, self.count))
+            file.write(self.bits)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            size, hashes, count = cls._header.unpack(file.read(cls._header.size))
+            bloom = cls(size=size, hashes=hashes)
+            bits = file.read()
+        if len(bits) != len(bloom.bits):
+            raise ValueError(f"{path} is not a complete bloom filter")
+        bloom.bits = bytearray(bits)
+        bloom.count = count
+        return bloom
+
+
+class DedupIndex:
+    """
+    Tweet ids already collected, to skip duplicates from reconnects, restarts and backfills.
+    - The last `recent` ids are kept exactly in memory: replays after a reconnect are caught without any lookup
+    - A Bloom filter answers "never seen" for new ids, the common case, from memory
+    - path: ids are also kept in a SQLite index (one integer row per id) that confirms the Bloom filter's maybes,
+      so no new tweet is ever dropped, and that survives restarts. The filter is saved next to it as <path>.bloom
+    - Without a path the index lives in memory: ids older than `recent` are only known through the Bloom filter,
+      so about error_rate of new tweets may be taken for duplicates
+    Works as the seen= set of Search: `tweet_id in index`, index.add(tweet_id).
+    """
+    def __init__(self, path=None, capacity=2000000, error_rate=0.001, recent=100000, flush_every=1000):
+        self.path = path
+        self.recent = recent
+        self.flush_every = flush_every
+        self._recent = OrderedDict()
+        self._pending = []
+        self._lock = threading.RLock()
+        self.counters = {'checked': 0, 'duplicates': 0, 'disk_lookups': 0, 'false_positives': 0}
+        self._db = None
+        self.bloom = None
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS ids (id INTEGER PRIMARY KEY)")
+            self._db.commit()
+            self.bloom = self._load_bloom(capacity, error_rate)
+        if self.bloom is None:
+            self.bloom = BloomFilter(capacity, error_rate)
+            if self._db is not None:
+                for (tweet_id,) in self._db.execute("SELECT id FROM ids"):
+                    self.bloom.add(str(tweet_id))
+
+    def _load_bloom(self, capacity, error_rate):
+        try:
+            bloom = BloomFilter.load(self.path + '.bloom')
+        except (OSError, ValueError, struct.error):
+            return None
+        stored = self._db.execute("SELECT count(*) FROM ids").fetchone()[0]
+        #A crash after the last save leaves ids the saved filter has not seen: rebuild it from the index
+        return bloom if bloom.count == stored else None
+
+    def _known(self, key):
+        if key in self._recent:
+            return True
+        if key not in self.bloom:
+            return False
+        if self._db is None:
+            return True
+        self._flush()
+        self.counters['disk_lookups'] += 1
+        found = self._db.execute("SELECT 1 FROM ids WHERE id=?", (int(key),)).fetchone() is not None
+        if not found:
+            self.counters['false_positives'] += 1
+        return found
+
+    def __contains__(self, tweet_id):
+        with self._lock:
+            return self._known(str(tweet_id))
+
+    def seen_recently(self, tweet_id):
+        """
+        True if the id is among the last `recent` ids added. Memory only: cheap enough to check every streamed line.
+        """
+        with self._lock:
+            return str(tweet_id) in self._recent
+
+    def add(self, tweet_id):
+        """
+        Record a tweet id. Returns True if it is new, False if it was already known.
+        """
+        key = str(tweet_id)
+        with self._lock:
+            self.counters['checked'] += 1
+            if self._known(key):
+                self.counters['duplicates'] += 1
+                return False
+            self._recent[key] = None
+            if len(self._recent) > self.recent:
+                self._recent.popitem(last=False)
+            self.bloom.add(key)
+            if self._db is not None:
+                self._pending.append((int(key),))
+                if len(self._pending) >= self.flush_every:
+                    self._flush()
+            return True
+
+    def _flush(self):
+        if self._pending:
+            self._db.executemany("INSERT OR IGNORE INTO ids VALUES (?)", self._pending)
+            self._db.commit()
+            self._pending = []
+
+    def flush(self):
+        """
+        Write pending ids and the Bloom filter to disk.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+                self.bloom.count = self._db.execute("SELECT count(*) FROM ids").fetchone()[0]
+                self.bloom.save(self.path + '.bloom')
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def stats(self):
+        """
+        Ids checked, duplicates found, disk lookups made and how many of them the Bloom filter sent for nothing.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats['ids'] = self.bloom.count
+        return stats
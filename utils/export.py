@@ -0,0 +1,123 @@
+import os
+from datetime import datetime, timezone
+from utils.helpers import optional_import
+
+pa = pq = None #pyarrow, imported on first use: only needed for Parquet/Arrow export
+
+
+#Fixed column layout per kind of page: (column, arrow type name, where to read it from the API object)
+COLUMNS = {
+    'tweets': [
+        ('id', 'string', ('id',)),
+        ('text', 'string', ('text',)),
+        ('created_at', 'timestamp', ('created_at',)),
+        ('retweet_count', 'int64', ('public_metrics', 'retweet_count')),
+        ('reply_count', 'int64', ('public_metrics', 'reply_count')),
+        ('like_count', 'int64', ('public_metrics', 'like_count')),
+        ('quote_count', 'int64', ('public_metrics', 'quote_count')),
+    ],
+    'users': [
+        ('id', 'string', ('id',)),
+        ('name', 'string', ('name',)),
+        ('username', 'string', ('username',)),
+        ('created_at', 'timestamp', ('created_at',)),
+        ('location', 'string', ('location',)),
+        ('verified', 'bool', ('verified',)),
+        ('followers_count', 'int64', ('public_metrics', 'followers_count')),
+        ('following_count', 'int64', ('public_metrics', 'following_count')),
+        ('tweet_count', 'int64', ('public_metrics', 'tweet_count')),
+        ('listed_count', 'int64', ('public_metrics', 'listed_count')),
+    ],
+}
+
+
+def _require_pyarrow():
+    global pa, pq
+    if pa is None:
+        pq = optional_import('pyarrow.parquet', "Parquet/Arrow export")
+        pa = optional_import('pyarrow', "Parquet/Arrow export")
+
+
+def parse_time(value):
+    """
+    Twitter's created_at ('2022-07-10T12:34:56.000Z') as a timezone aware datetime. None stays None.
+    """
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+
+def schema(kind):
+    """
+    Arrow schema for 'tweets' or 'users' pages. Counts are nullable int64: missing metrics are nulls, not 'no data'.
+    """
+    _require_pyarrow()
+    types = {'string': pa.string(), 'int64': pa.int64(), 'bool': pa.bool_(), 'timestamp': pa.timestamp('ms', tz='UTC')}
+    return pa.schema([(name, types[kind_of]) for name, kind_of, _ in COLUMNS[kind]])
+
+
+def to_record_batch(rows, kind):
+    """
+    Convert one page of raw API objects (as returned in 'data', before _mini_clean) to an Arrow record batch.
+    """
+    _require_pyarrow()
+    layout = schema(kind)
+    arrays = []
+    for name, kind_of, source in COLUMNS[kind]:
+        values = []
+        for row in rows:
+            value = row.get(source[0])
+            if len(source) > 1:
+                value = (value or {}).get(source[1])
+            if kind_of == 'timestamp':
+                value = parse_time(value)
+            values.append(value)
+        arrays.append(values)
+    return pa.RecordBatch.from_arrays([pa.array(values, type=field.type) for values, field in zip(arrays, layout)], schema=layout)
+
+
+def free_path(path):
+    """
+    path if nothing is there yet, otherwise the first <name>_0001<ext>, <name>_0002<ext>, ... that is free.
+    """
+    if not os.path.exists(path):
+        return path
+    name, extension = os.path.splitext(path)
+    part = 1
+    while os.path.exists(f"{name}_{part:04d}{extension}"):
+        part += 1
+    return f"{name}_{part:04d}{extension}"
+
+
+class ParquetExporter:
+    """
+    Write pages of tweets or users to a Parquet file as they arrive, so nothing but the current page is held in memory.
+    kind: 'tweets' or 'users'
+    overwrite=False: if path exists, write to the next free part <name>_0001.parquet, <name>_0002.parquet, ... instead.
+    self.path is the file written
+    """
+    def __init__(self, path, kind, compression='snappy', overwrite=True):
+        _require_pyarrow()
+        if kind not in COLUMNS:
+            raise ValueError(f"Unknown export kind '{kind}'. Use one of {list(COLUMNS)}")
+        self.path = path if overwrite else free_path(path)
+        self.kind = kind
+        self.rows = 0
+        self._writer = pq.ParquetWriter(path, schema(kind), compression=compression)
+
+    def write_page(self, rows):
+        if not rows:
+            return
+        self._writer.write_batch(to_record_batch(rows, self.kind))
+        self.rows += len(rows)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
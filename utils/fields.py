@@ -0,0 +1,80 @@
+import hashlib
+
+#Fields the API v2 accepts per object (https://developer.twitter.com/en/docs/twitter-api/fields)
+TWEET_FIELDS = frozenset(('attachments', 'author_id', 'context_annotations', 'conversation_id', 'created_at', 'edit_controls',
+                          'edit_history_tweet_ids', 'entities', 'geo', 'id', 'in_reply_to_user_id', 'lang', 'non_public_metrics',
+                          'organic_metrics', 'possibly_sensitive', 'promoted_metrics', 'public_metrics', 'referenced_tweets',
+                          'reply_settings', 'source', 'text', 'withheld'))
+USER_FIELDS = frozenset(('created_at', 'description', 'entities', 'id', 'location', 'name', 'pinned_tweet_id', 'profile_image_url',
+                         'protected', 'public_metrics', 'url', 'username', 'verified', 'withheld'))
+PLACE_FIELDS = frozenset(('contained_within', 'country', 'country_code', 'full_name', 'geo', 'id', 'name', 'place_type'))
+EXPANSIONS = frozenset(('attachments.poll_ids', 'attachments.media_keys', 'author_id', 'edit_history_tweet_ids', 'entities.mentions.username',
+                        'geo.place_id', 'in_reply_to_user_id', 'referenced_tweets.id', 'referenced_tweets.id.author_id', 'pinned_tweet_id'))
+
+#What each kind of call asked for before field selection existed: the defaults
+LOOKUP = {
+    'tweet.fields': 'source,created_at,geo,author_id,referenced_tweets',
+    'user.fields': 'created_at,description,entities,id,location,name,pinned_tweet_id,profile_image_url,protected,public_metrics,url,username,verified,withheld',
+    'place.fields': 'contained_within,country,country_code,full_name,geo,id,name,place_type',
+    'expansions': 'author_id,referenced_tweets.id.author_id',
+}
+PROFILE = {'user.fields': 'description,created_at,pinned_tweet_id,location,verified,profile_image_url,public_metrics'}
+TIMELINE = {'tweet.fields': 'created_at,public_metrics'}
+FOLLOWERS = {'user.fields': 'created_at,public_metrics,location,verified'}
+
+
+class Fields:
+    """
+    Server-side field selection: ask the API for only the fields you use, so responses are smaller.
+    - tweet / user / place / expansions: iterables of API field names, or a comma separated string.
+      None keeps the default of each call, an empty value leaves the parameter out
+    - Unknown names raise ValueError here rather than a 400 from the API later
+    Fields.minimal() is enough for ids, text, dates and author names.
+    """
+    known = {'tweet.fields': TWEET_FIELDS, 'user.fields': USER_FIELDS, 'place.fields': PLACE_FIELDS, 'expansions': EXPANSIONS}
+
+    def __init__(self, tweet=None, user=None, place=None, expansions=None):
+        self.selected = {}
+        for parameter, names in (('tweet.fields', tweet), ('user.fields', user), ('place.fields', place), ('expansions', expansions)):
+            if names is None:
+                continue
+            if isinstance(names, str):
+                names = names.split(',')
+            names = [name.strip() for name in names if name.strip()]
+            unknown = set(names) - self.known[parameter]
+            if unknown:
+                raise ValueError(f"Unknown {parameter}: {sorted(unknown)}. Use some of {sorted(self.known[parameter])}")
+            self.selected[parameter] = ','.join(dict.fromkeys(names))
+
+    @classmethod
+    def minimal(cls):
+        return cls(tweet=('created_at', 'author_id', 'referenced_tweets'), user=('username', 'name'), place=(), expansions=('author_id',))
+
+    def params(self, defaults):
+        """
+        Query parameters of a call whose default selection is `defaults` (one of LOOKUP, PROFILE, TIMELINE, FOLLOWERS).
+        Only parameters the call takes are returned.
+        """
+        params = {}
+        for parameter, default in defaults.items():
+            value = self.selected.get(parameter, default)
+            if value:
+                params[parameter] = value
+        return params
+
+    def cache_key(self, key, defaults):
+        """
+        Cache key of an object fetched by a call whose default selection is `defaults`. Objects fetched with
+        other fields than the defaults are kept under their own key, so a narrow object never answers for a full one.
+        """
+        params = self.params(defaults)
+        if params == {parameter: value for parameter, value in defaults.items() if value}:
+            return key
+        selection = ';'.join(f"{parameter}={value}" for parameter, value in sorted(params.items()))
+        return f"{key}|{hashlib.blake2b(selection.encode(), digest_size=6).hexdigest()}"
+
+    def __repr__(self):
+        return f"Fields({self.selected})"
+
+
+default_fields = Fields()
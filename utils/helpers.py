@@ -1,3 +1,4 @@
+import importlib
 from enum import Enum
 
 
@@ -22,11 +23,28 @@ class StreamException(Exception):
     ...
 
 
+def optional_import(module, feature, package=None):
+    """
+    Import an optional dependency when the feature that needs it is first used, so importing TwiFesh stays fast.
+    Raises ImportError with the pip command if it is not installed.
+    """
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        package = package or module.split('.')[0]
+        raise ImportError(f"{feature} requires {package}. Install it with: pip install {package}") from None
+
+
+API_ROOT = "https://api.twitter.com"
+
+
 class Url(Enum):
     """ Handling Static urls """
     
-    tweets = "https://api.twitter.com/2/tweets/"
-    user= "https://api.twitter.com/2/users"
+    tweets = f"{API_ROOT}/2/tweets/"
+    user= f"{API_ROOT}/2/users"
     profile = f"{user}/by"
-    rules= "https://api.twitter.com/2/tweets/search/stream/rules"
-    stream = "https://api.twitter.com/2/tweets/search/stream"
+    rules= f"{API_ROOT}/2/tweets/search/stream/rules"
+    stream = f"{API_ROOT}/2/tweets/search/stream"
+    search_recent = f"{API_ROOT}/2/tweets/search/recent"
+    search_all = f"{API_ROOT}/2/tweets/search/all"
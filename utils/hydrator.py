@@ -0,0 +1,168 @@
+import time, threading
+from queue import Queue, Empty, Full
+from utils import metrics
+
+
+class Hydrator:
+    """
+    Batched, asynchronous hydration of streamed tweets.
+    - Stream lines are submitted to a bounded queue and never block the reader.
+    - Worker threads drain the queue into batches of up to batch_size ids (max 100, the /2/tweets limit)
+      and flush a batch early once flush_interval seconds have passed since its first tweet.
+    - Each batch is one lookup call: lookup(ids) -> (status, list of payloads | message)
+    - Every hydrated payload (or failure message) is handed to callback(status, details)
+    """
+    MAX_BATCH = 100
+
+    def __init__(self, lookup, callback, batch_size=100, flush_interval=1.0, workers=2, max_queue=10000, late_after=30):
+        self.lookup = lookup
+        self.callback = callback
+        self.batch_size = max(1, min(batch_size, self.MAX_BATCH))
+        self.flush_interval = flush_interval
+        self.workers = max(1, workers)
+        self.late_after = late_after #seconds from receipt after which a hydrated tweet is counted as late
+        self.queue = Queue(maxsize=max_queue)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._closed = threading.Event() #set by stop(): a worker that outlived it drops its batch instead of calling back
+        self._lock = threading.Lock()
+        self.counters = {'received': 0, 'hydrated': 0, 'dropped': 0, 'late': 0, 'missing': 0, 'batches': 0, 'errors': 0}
+        self.lost_since = None #wall clock receive time of the oldest tweet never delivered (dropped or in a failed batch)
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stopping.clear()
+        self._closed.clear()
+        for number in range(self.workers):
+            worker = threading.Thread(target=self._work, name=f"twifesh-hydrator-{number}", daemon=True)
+            worker.start()
+            self._threads.append(worker)
+        return self
+
+    def stop(self, drain=True, timeout=None):
+        """
+        Stop the workers. With drain=True whatever is still queued is hydrated first.
+        timeout: seconds to wait for that and for the workers. Tweets still queued then are counted as dropped.
+        Returns the number of tweets dropped this way.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if drain:
+            while self.queue.qsize() and (deadline is None or time.monotonic() < deadline):
+                time.sleep(0.05)
+        self._stopping.set()
+        for worker in self._threads:
+            worker.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+        self._threads = []
+        self._closed.set()
+        discarded = []
+        while True:
+            try:
+                discarded.append(self.queue.get_nowait())
+            except Empty:
+                break
+            self.queue.task_done()
+        if discarded:
+            self._drop(discarded)
+        return len(discarded)
+
+    def submit(self, tweet):
+        """
+        Queue a streamed tweet ('data' object of a stream line) for hydration.
+        Returns False if the queue is full and the tweet was dropped.
+        """
+        try:
+            self.queue.put_nowait((time.monotonic(), tweet))
+        except Full:
+            self._drop([(time.monotonic(), tweet)])
+            return False
+        self._count('received')
+        return True
+
+    @property
+    def stats(self):
+        """
+        Snapshot of the backpressure counters plus the current queue depth.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['queue_size'] = self.queue.maxsize
+        return stats
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def _lost(self, entries):
+        #entries: (monotonic receive time, tweet)
+        received = time.time() - (time.monotonic() - min(received for received, _ in entries))
+        with self._lock:
+            if self.lost_since is None or received < self.lost_since:
+                self.lost_since = received
+
+    def _drop(self, entries):
+        self._count('dropped', len(entries))
+        metrics.dropped_total.inc(len(entries), stage='hydration')
+        self._lost(entries)
+
+    def _next_batch(self):
+        try:
+            first = self.queue.get(timeout=0.5)
+        except Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _work(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._hydrate(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _hydrate(self, batch):
+        ids = [tweet['id'] for _, tweet in batch]
+        while True:
+            try:
+                status, details = self.lookup(ids)
+            except Exception as e:
+                status, details = False, f"error fetching full tweet details: => {e}"
+            self._count('batches')
+            if status or 'rate limit reached' not in details:
+                break
+            #Hold on to the batch and retry: the lookup's rate limiter holds the call until the window resets
+            self.callback(False, details)
+        if self._closed.is_set():
+            self._drop(batch) #stop() gave up waiting for this batch
+            return
+        if not status:
+            self._count('errors')
+            self._lost(batch)
+            self.callback(False, details)
+            return
+
+        by_id = {payload['tweet_id']: payload for payload in details}
+        now = time.monotonic()
+        for received, tweet in batch:
+            payload = by_id.get(tweet['id'])
+            if payload is None:
+                self._count('missing') #deleted or protected before we could look it up
+                continue
+            if now - received > self.late_after:
+                self._count('late')
+            self._count('hydrated')
+            self.callback(True, payload)
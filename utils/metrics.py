@@ -0,0 +1,259 @@
+import bisect, threading
+
+#Seconds: spans a local mock call to a slow lookup held up on the API side
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def endpoint_label(endpoint):
+    """
+    Readable label for a rate limit key: Url.tweets -> 'tweets', (Url.user, 'followers') -> 'user/followers'.
+    """
+    if endpoint is None:
+        return 'other'
+    if isinstance(endpoint, tuple):
+        return '/'.join(endpoint_label(part) for part in endpoint)
+    return getattr(endpoint, 'name', str(endpoint))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, values, extra)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Value that only goes up, e.g. calls made. inc(amount, **labels)
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down, e.g. a queue depth. set(value, **labels), or set_function(fn, **labels)
+    to read fn() every time the gauge is collected.
+    """
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels):
+        self.set(function, **labels)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def value(self, **labels):
+        with self._lock:
+            value = self._values.get(self._key(labels))
+        return value() if callable(value) else value
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+        snapshot = {}
+        for key, value in values.items():
+            try:
+                snapshot[key] = value() if callable(value) else value
+            except Exception:
+                continue #the object behind a function gauge is gone or failing: leave it out
+        return snapshot
+
+    def samples(self):
+        return [('', key, (), value) for key, value in self.snapshot().items()]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. latencies, in cumulative buckets. observe(value, **labels)
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        """
+        {labels: {'count', 'sum', 'mean', 'buckets': {upper bound: cumulative count}}}
+        """
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        snapshot = {}
+        for key, (counts, total, count) in values.items():
+            cumulative, running = {}, 0
+            for bound, number in zip(self.buckets + (float('inf'),), counts):
+                running += number
+                cumulative[bound] = running
+            snapshot[key] = {'count': count, 'sum': total, 'mean': total / count if count else 0.0, 'buckets': cumulative}
+        return snapshot
+
+    def samples(self):
+        samples = []
+        for key, entry in self.snapshot().items():
+            for bound, count in entry['buckets'].items():
+                samples.append(('_bucket', key, [('le', '+Inf' if bound == float('inf') else f'{bound:g}')], count))
+            samples.append(('_sum', key, (), entry['sum']))
+            samples.append(('_count', key, (), entry['count']))
+        return samples
+
+
+class Registry:
+    """
+    In-process collection of metrics.
+    - counter/gauge/histogram: create a metric, or return the one already registered under that name
+    - snapshot(): every metric as plain dicts, for logging or asserting on in a notebook
+    - render(): Prometheus text exposition format, see serve_metrics
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, help, labels, **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def snapshot(self):
+        """
+        {metric name: {labels joined with '/': value}}. Unlabelled metrics are under ''.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: {'/'.join(key): value for key, value in metric.snapshot().items()} for metric in metrics}
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+#Default registry, fed by every Transport and Stream
+registry = Registry()
+
+requests_total = registry.counter('twifesh_requests_total', "API calls by endpoint and HTTP status ('error' when no response came back)", ('endpoint', 'status'))
+request_seconds = registry.histogram('twifesh_request_seconds', "API call latency in seconds, rate limit waits excluded", ('endpoint',))
+response_bytes = registry.counter('twifesh_response_bytes_total', "Response body bytes received (after decompression)", ('endpoint',))
+rate_limit_remaining = registry.gauge('twifesh_rate_limit_remaining', "Calls left in the current rate limit window, from x-rate-limit-remaining", ('endpoint',))
+rate_limit_hits = registry.counter('twifesh_rate_limited_total', "HTTP 429 answers", ('endpoint',))
+stream_tweets = registry.counter('twifesh_stream_tweets_total', "Tweets read from the filtered stream")
+stream_reconnects = registry.counter('twifesh_stream_reconnects_total', "Stream reconnects by back-off policy", ('policy',))
+queue_depth = registry.gauge('twifesh_queue_depth', "Records waiting in each internal queue", ('queue',))
+dropped_total = registry.counter('twifesh_dropped_total', "Records dropped because a stage fell behind", ('stage',))
+cache_lookups = registry.counter('twifesh_cache_lookups_total', "TTLCache lookups by kind and outcome", ('kind', 'outcome'))
+
+
+def cache_hit_ratio(registry=registry):
+    """
+    {kind: hit ratio} over every TTLCache since start.
+    """
+    counts = {}
+    for (kind, outcome), value in registry.get('twifesh_cache_lookups_total').snapshot().items():
+        counts.setdefault(kind, {'hit': 0, 'miss': 0})[outcome] = value
+    return {kind: count['hit'] / (count['hit'] + count['miss']) if count['hit'] + count['miss'] else 0.0 for kind, count in counts.items()}
+
+
+def serve_metrics(port=9464, host='127.0.0.1', registry=registry):
+    """
+    Serve the registry at http://host:port/metrics for Prometheus to scrape, from a background thread.
+    Returns the server: call shutdown() on it to stop.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="twifesh-metrics", daemon=True).start()
+    return server
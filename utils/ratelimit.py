@@ -0,0 +1,108 @@
+import time, threading
+
+
+class Bucket:
+    """
+    Budget of one endpoint as last reported by the API, minus the calls we made since.
+    """
+    __slots__ = ('limit', 'remaining', 'reset', 'next_at')
+
+    def __init__(self, limit, remaining, reset):
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset #epoch seconds at which the window starts over
+        self.next_at = 0.0 #earliest epoch time the next paced call may go out
+
+
+class RateLimiter:
+    """
+    Rate-limit-aware scheduler keyed by endpoint (a Url member, or a tuple such as (Url.user, 'followers')).
+    - update() reads x-rate-limit-limit/remaining/reset from every response
+    - acquire() blocks the calling thread only as long as needed to stay within the budget:
+      calls go straight out while more than `reserve` of the window's limit is left, after that
+      the remaining calls are spread evenly until the reset, and at zero we wait for the reset.
+    - Thread safe: one limiter shared through a Transport lets several Profiler/Profile/Stream jobs share a budget.
+      Endpoints are independent, so a call on one endpoint never waits behind another's limit.
+    """
+    fallback_window = 60*15 #Twitter windows are 15 minutes. Used when a 429 comes without headers
+
+    def __init__(self, reserve=0.1):
+        self.reserve = reserve
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Reserve one call on the endpoint, sleeping first if the budget requires it.
+        """
+        while True:
+            wait = self.try_acquire(key)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self, key):
+        """
+        Non-blocking acquire: reserves a call and returns 0, or returns the seconds to wait before trying again.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0
+            now = time.time()
+            if now >= bucket.reset:
+                #Window is over: forget it, the next response tells us the new budget
+                del self._buckets[key]
+                return 0
+            if bucket.remaining <= 0:
+                return bucket.reset - now + 1
+            if bucket.remaining > bucket.limit * self.reserve:
+                bucket.remaining -= 1
+                return 0
+            if bucket.next_at > now:
+                return bucket.next_at - now
+            bucket.next_at = now + (bucket.reset - now) / bucket.remaining
+            bucket.remaining -= 1
+            return 0
+
+    def update(self, key, response):
+        """
+        Refresh the endpoint's budget from a response.
+        """
+        headers = response.headers
+        try:
+            limit = int(headers['x-rate-limit-limit'])
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = int(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            if response.status_code != 429:
+                return
+            limit, remaining, reset = 1, 0, time.time() + self.fallback_window
+        if response.status_code == 429:
+            remaining = 0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.reset != reset:
+                self._buckets[key] = Bucket(limit, remaining, reset)
+            else:
+                #Same window: responses can arrive out of order, keep the lowest count seen
+                bucket.limit = limit
+                bucket.remaining = min(bucket.remaining, remaining)
+
+    def wait_time(self, key):
+        """
+        Seconds until the endpoint's window resets if its budget is spent, otherwise 0.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.remaining > 0:
+                return 0
+            return max(0, bucket.reset - time.time())
+
+    def status(self):
+        """
+        Current budget per endpoint: {key: {'limit', 'remaining', 'reset'}}
+        """
+        with self._lock:
+            return {key: {'limit': bucket.limit, 'remaining': bucket.remaining, 'reset': bucket.reset}
+                    for key, bucket in self._buckets.items()}
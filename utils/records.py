@@ -0,0 +1,252 @@
+def record_id(record):
+    """
+    Tweet id of any record TwiFesh outputs: hydrated tweets, raw stream lines ({'data': tweet}) or API objects.
+    """
+    return record.get('tweet_id') or (record.get('data') or {}).get('id') or record.get('id')
+
+
+def record_time(record):
+    """
+    created_at of any record TwiFesh outputs, None if the fields selected left it out.
+    """
+    return record.get('created_at') or (record.get('data') or {}).get('created_at')
+
+
+def _referenced_ids(data, kind):
+    referenced = data.get('referenced_tweets')
+    if not referenced:
+        return None
+    return ','.join([line['id'] for line in referenced if line.get('type') == kind])
+
+
+def tweet_payload(data, author, clean):
+    """
+    The hydrated tweet as a plain dict: the record Stream(full_details=True) has always produced.
+    data: the tweet object, author: its user object from includes (or {}), clean: text -> cleaned text
+    """
+    metrics = author.get('public_metrics') or {}
+    return {
+        'tweet_id': data.get('id'),
+        'created_at': data.get('created_at'),
+        'tweet_author_id': data.get('author_id'),
+        'tweet_author_description': author.get('description'),
+        'tweet_author_username': author.get('username'),
+        'tweet_author_location': author.get('location'),
+        'tweet_author_image': author.get('profile_image_url'),
+        'tweet_author_join_date': author.get('created_at'),
+        'tweet_author_following_count': metrics.get('following_count'),
+        'tweet_author_followers_count': metrics.get('followers_count'),
+        'tweet_author_total_tweets': metrics.get('tweet_count'),
+        'tweet_author_verified': author.get('verified'),
+        'tweet_author_name': author.get('name'),
+        'tweet': data.get('text'),
+        'cleaned_tweet': clean(data.get('text')),
+        'source': data.get('source'),
+        'quoted_id': _referenced_ids(data, 'quoted'),
+        'in_reply_to_id': _referenced_ids(data, 'replied_to'),
+    }
+
+
+class Record:
+    """
+    Read-only mapping over the API's own objects: values are looked up (and nested objects flattened)
+    only when asked for, nothing is copied up front.
+    Behaves like the dict it stands for: record['key'], get, keys, items, to_dict, == dict.
+    Anything serializing records (utils.writer.dumps, the sinks) goes through to_dict().
+    """
+    __slots__ = ()
+
+    def keys(self):
+        raise NotImplementedError
+
+    def _value(self, key):
+        """
+        Value of key, KeyError if the record has no such key.
+        """
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        return self._value(key)
+
+    def get(self, key, default=None):
+        try:
+            return self._value(key)
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self._value(key)) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def _author_metric(name):
+    return lambda record: (record.author.get('public_metrics') or {}).get(name)
+
+
+class TweetRecord(Record):
+    """
+    Compact hydrated tweet with the same keys as the dict records (tweet_payload).
+    Holds the tweet object and a reference to its author object, shared by every tweet of that author in a lookup.
+    cleaned_tweet is computed on first access and kept.
+    """
+    __slots__ = ('data', 'author', '_clean', '_cleaned')
+
+    def __init__(self, data, author=None, clean=None, cleaned=None):
+        self.data = data
+        self.author = author or {}
+        self._clean = clean
+        self._cleaned = cleaned
+
+    def _cleaned_tweet(self):
+        if self._cleaned is None and self._clean is not None:
+            self._cleaned = self._clean(self.data.get('text'))
+        return self._cleaned
+
+    def keys(self):
+        return _TWEET_KEYS
+
+    def _value(self, key):
+        return _TWEET_GETTERS[key](self)
+
+    def __getattr__(self, key):
+        #Keys are attributes too: record.tweet_author_username
+        getter = _TWEET_GETTERS.get(key)
+        if getter is None:
+            raise AttributeError(key)
+        return getter(self)
+
+    def __reduce__(self):
+        #Clean before pickling (e.g. in a worker process) instead of sending the cleaner along
+        return (TweetRecord, (self.data, self.author, None, self._cleaned_tweet()))
+
+
+_TWEET_GETTERS = {
+    'tweet_id': lambda record: record.data.get('id'),
+    'created_at': lambda record: record.data.get('created_at'),
+    'tweet_author_id': lambda record: record.data.get('author_id'),
+    'tweet_author_description': lambda record: record.author.get('description'),
+    'tweet_author_username': lambda record: record.author.get('username'),
+    'tweet_author_location': lambda record: record.author.get('location'),
+    'tweet_author_image': lambda record: record.author.get('profile_image_url'),
+    'tweet_author_join_date': lambda record: record.author.get('created_at'),
+    'tweet_author_following_count': _author_metric('following_count'),
+    'tweet_author_followers_count': _author_metric('followers_count'),
+    'tweet_author_total_tweets': _author_metric('tweet_count'),
+    'tweet_author_verified': lambda record: record.author.get('verified'),
+    'tweet_author_name': lambda record: record.author.get('name'),
+    'tweet': lambda record: record.data.get('text'),
+    'cleaned_tweet': TweetRecord._cleaned_tweet,
+    'source': lambda record: record.data.get('source'),
+    'quoted_id': lambda record: _referenced_ids(record.data, 'quoted'),
+    'in_reply_to_id': lambda record: _referenced_ids(record.data, 'replied_to'),
+}
+_TWEET_KEYS = tuple(_TWEET_GETTERS)
+
+
+class FlatRecord(Record):
+    """
+    API object with its public_metrics flattened into top level counts, as Profiler's dict records.
+    Subclasses list the counts. A missing count reads 'no data'; without public_metrics there are no count keys.
+    """
+    __slots__ = ('raw',)
+    counts = ()
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def keys(self):
+        keys = [key for key in self.raw if key != 'public_metrics']
+        if 'public_metrics' in self.raw:
+            keys.extend(self.counts)
+        return keys
+
+    def _value(self, key):
+        if key in self.counts and 'public_metrics' in self.raw:
+            return (self.raw['public_metrics'] or {}).get(key, 'no data')
+        if key == 'public_metrics':
+            raise KeyError(key)
+        return self.raw[key]
+
+    def __getattr__(self, key):
+        if key.startswith('_') or key == 'raw':
+            raise AttributeError(key) #not set yet, e.g. while unpickling
+        try:
+            return self._value(key)
+        except KeyError:
+            raise AttributeError(key) from None
+
+
+class TimelineTweet(FlatRecord):
+    __slots__ = ()
+    counts = ('retweet_count', 'reply_count', 'like_count', 'quote_count')
+
+
+class UserSummary(FlatRecord):
+    __slots__ = ()
+    counts = ('followers_count', 'following_count', 'tweet_count', 'listed_count')
+
+
+def flatten_metrics(line, counts):
+    """
+    Dict flavour of FlatRecord: move public_metrics' counts to the top level of line, in place.
+    """
+    if 'public_metrics' not in line:
+        return line
+    public_metrics = line.pop('public_metrics') or {}
+    for name in counts:
+        line[name] = public_metrics.get(name, 'no data')
+    return line
+
+
+class RecordBatch:
+    """
+    Struct of arrays: a batch of records held as one list per key instead of one mapping per record.
+    Cheaper to build columnar output from (DataFrames, Arrow) and to aggregate over.
+    - RecordBatch.from_records(records, keys=None): keys default to those of the first record
+    - batch.columns[key] / batch.column(key): all values of a key, batch[i]: record i as a dict
+    """
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.length = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_records(cls, records, keys=None):
+        records = list(records)
+        if keys is None:
+            keys = list(records[0].keys()) if records else []
+        return cls({key: [record.get(key) for record in records] for key in keys})
+
+    def column(self, key):
+        return self.columns[key]
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return {key: values[index] for key, values in self.columns.items()}
+
+    def rows(self):
+        return [self[index] for index in range(self.length)]
@@ -0,0 +1,148 @@
+import logging
+from utils.helpers import RulesException, Url
+
+logger = logging.getLogger('twifesh.rules')
+
+
+def quote_keyword(keyword):
+    """
+    Group a multi-word keyword, so 'a b OR c' reads as (a b) OR c however it is combined.
+    """
+    keyword = keyword.strip()
+    if ' ' in keyword and not (keyword.startswith('(') and keyword.endswith(')')):
+        return f"({keyword})"
+    return keyword
+
+
+def join_keywords(keywords):
+    return ' OR '.join(quote_keyword(keyword) for keyword in keywords if keyword.strip())
+
+
+def pack_keywords(keywords, max_length=512, tag=None):
+    """
+    Fit keywords into as few rules as possible: keyword1 OR keyword2 ... up to max_length characters per rule.
+    Returns [{'value', 'tag'}]. Keyword order is kept; duplicates are dropped.
+    """
+    rules = []
+    current = ''
+    for keyword in dict.fromkeys(quote_keyword(keyword) for keyword in keywords if keyword.strip()):
+        if len(keyword) > max_length:
+            raise ValueError(f"Keyword '{keyword}' is longer than the {max_length} characters a rule can hold")
+        candidate = f"{current} OR {keyword}" if current else keyword
+        if len(candidate) > max_length:
+            rules.append(current)
+            candidate = keyword
+        current = candidate
+    if current:
+        rules.append(current)
+    return [{'value': value, 'tag': tag} for value in rules]
+
+
+def _key(rule):
+    return rule['value'], rule.get('tag') or None
+
+
+class RuleManager:
+    """
+    Keep the filtered stream's rules in line with a desired set by applying only the difference.
+    - sync(desired): adds the desired rules that are missing, then deletes the ones no longer wanted. Rules are
+      matched on value and tag, so unchanged rules are left alone and an open connection keeps delivering throughout.
+      When adding first would go over max_rules, just enough unwanted rules are deleted before the adds.
+      Rule changes apply to a live connection without reconnecting
+    - dry_run: let the API validate the change without applying it
+    - max_length / max_rules: rule length and count allowed by your access level (Essential: 512 and 5,
+      Elevated: 512 and 25, Academic Research: 1024 and 1000). keyword_rules packs keywords within them
+    """
+    def __init__(self, transport, max_length=512, max_rules=5):
+        self.transport = transport
+        self.max_length = max_length
+        self.max_rules = max_rules
+
+    def keyword_rules(self, keywords, tag=None):
+        rules = pack_keywords(keywords, self.max_length, tag)
+        if self.max_rules is not None and len(rules) > self.max_rules:
+            raise RulesException(f"{len(keywords)} keywords need {len(rules)} rules of up to {self.max_length} characters, "
+                                 f"only {self.max_rules} are allowed: use fewer keywords")
+        return rules
+
+    def current(self):
+        """
+        The rules on the server: [{'id', 'value', 'tag'}]
+        """
+        response = self.transport.get(Url.rules.value, endpoint=Url.rules)
+        if response.status_code != 200:
+            raise RulesException(f"Cannot get rules (HTTP {response.status_code}): {response.text}")
+        return response.json().get('data') or []
+
+    def diff(self, desired, current=None):
+        """
+        (rules to add, rules to delete) to go from current (the server's rules by default) to desired.
+        """
+        if current is None:
+            current = self.current()
+        wanted = {_key(rule): rule for rule in desired}
+        existing = {_key(rule): rule for rule in current}
+        to_add = [{'value': rule['value'], **({'tag': rule['tag']} if rule.get('tag') else {})} for key, rule in wanted.items() if key not in existing]
+        to_delete = [rule for key, rule in existing.items() if key not in wanted]
+        #Several server rules can share a value and tag: only one is kept
+        kept = {id(rule) for rule in existing.values()}
+        to_delete.extend(rule for rule in current if id(rule) not in kept)
+        return to_add, to_delete
+
+    def sync(self, desired, dry_run=False, prune=True):
+        """
+        Make the server's rules match desired ([{'value', 'tag'}], see keyword_rules).
+        prune=False only adds: rules not in desired are kept.
+        Returns {'added', 'deleted', 'kept'} counts.
+        """
+        current = self.current()
+        to_add, to_delete = self.diff(desired, current)
+        if not prune:
+            to_delete = []
+        if self.max_rules is not None and len(current) - len(to_delete) + len(to_add) > self.max_rules:
+            raise RulesException(f"{len(current) - len(to_delete)} rules kept and {len(to_add)} added would go over the {self.max_rules} rules allowed: "
+                                 f"{'use fewer rules' if prune else 'sync with prune=True to delete the unwanted ones'}")
+        #Rules over the cap while the new ones are added: delete that many unwanted rules first
+        overflow = max(0, len(current) + len(to_add) - self.max_rules) if self.max_rules is not None else 0
+        first, last = to_delete[:overflow], to_delete[overflow:]
+        if first:
+            self.delete([rule['id'] for rule in first], dry_run)
+        if to_add:
+            self._add_within_cap(to_add, dry_run, len(current))
+        if last:
+            self.delete([rule['id'] for rule in last], dry_run)
+        summary = {'added': len(to_add), 'deleted': len(to_delete), 'kept': len(current) - len(to_delete)}
+        logger.info(f"Rules {'validated' if dry_run else 'synced'}: {summary['added']} added, {summary['deleted']} deleted, {summary['kept']} unchanged",
+                    extra={'event': 'rules_synced', 'dry_run': dry_run, **summary})
+        return summary
+
+    def _add_within_cap(self, rules, dry_run, current):
+        if not dry_run or self.max_rules is None:
+            return self.add(rules, dry_run)
+        #Nothing is deleted in a dry run, so the API checks the adds against the current rules:
+        #validate them in groups that fit next to those
+        room = self.max_rules - current
+        if room <= 0:
+            logger.info(f"{len(rules)} rule(s) to add not validated: the current rules already fill the {self.max_rules} allowed",
+                        extra={'event': 'rules_not_validated', 'rules': len(rules)})
+            return None
+        for start in range(0, len(rules), room):
+            self.add(rules[start:start + room], dry_run)
+
+    def add(self, rules, dry_run=False):
+        return self._post({'add': rules}, dry_run, 'add')
+
+    def delete(self, ids, dry_run=False):
+        return self._post({'delete': {'ids': list(ids)}}, dry_run, 'delete')
+
+    def _post(self, payload, dry_run, action):
+        params = {'dry_run': 'true'} if dry_run else None
+        response = self.transport.post(Url.rules.value, json=payload, params=params, endpoint=Url.rules)
+        if response.status_code not in (200, 201):
+            raise RulesException(f"Cannot {action} rules (HTTP {response.status_code}): {response.text}")
+        result = response.json()
+        invalid = ((result.get('meta') or {}).get('summary') or {}).get('invalid', 0)
+        errors = [error for error in result.get('errors') or [] if error.get('title') != 'DuplicateRule']
+        if invalid or errors:
+            raise RulesException(f"Cannot {action} rules: {errors or result}")
+        return result
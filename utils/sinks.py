@@ -0,0 +1,240 @@
+import io, sys, gzip, json, time, logging, threading
+from queue import Queue, Empty, Full
+from utils.writer import JsonlWriter, dumps, to_json
+from utils.records import RecordBatch, record_id
+from utils import metrics
+from utils.helpers import optional_import
+
+logger = logging.getLogger('twifesh.sinks')
+
+
+class Sink:
+    """
+    Destination for streamed tweets. Subclasses implement write_batch, and close if they hold resources.
+    - batch_size / flush_interval: the dispatcher hands over up to batch_size records at once,
+      or whatever it has after flush_interval seconds
+    """
+    batch_size = 100
+    flush_interval = 1.0
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def write_batch(self, records):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StdoutSink(Sink):
+    """
+    Print every tweet, as TwiFesh always did. Printing is slow at high volume: leave it out of the sinks for speed.
+    json_lines: write one JSON object per line instead, for piping into jq or another program
+    """
+    flush_interval = 0.2
+
+    def __init__(self, json_lines=False):
+        self.json_lines = json_lines
+
+    def write_batch(self, records):
+        if self.json_lines:
+            sys.stdout.buffer.write(b''.join(dumps(record) for record in records))
+            sys.stdout.buffer.flush()
+            return
+        for record in records:
+            print(record, '\n')
+
+
+class FileSink(Sink):
+    """
+    JSON lines file through a buffered JsonlWriter (rotation, compression, fsync policy).
+    Takes a JsonlWriter or a path.
+    """
+    def __init__(self, writer):
+        self.writer = writer if isinstance(writer, JsonlWriter) else JsonlWriter(writer)
+
+    def write_batch(self, records):
+        for record in records:
+            self.writer.write(record)
+
+    def close(self):
+        self.writer.close()
+
+
+class CallbackSink(Sink):
+    """
+    Call callback(record) for every tweet, or callback(records) once per batch with batch=True.
+    columnar=True hands each batch over as a utils.records.RecordBatch (one list per key) instead.
+    """
+    def __init__(self, callback, batch=False, batch_size=100, columnar=False):
+        self.callback = callback
+        self.batch = batch
+        self.batch_size = batch_size
+        self.columnar = columnar
+
+    def write_batch(self, records):
+        if self.columnar:
+            self.callback(RecordBatch.from_records(records))
+        elif self.batch:
+            self.callback(records)
+        else:
+            for record in records:
+                self.callback(record)
+
+
+class QueueSink(Sink):
+    """
+    Put every tweet on a queue.Queue for in-process consumers. Blocks (on the sink's own thread) if the queue is full.
+    """
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else Queue()
+
+    def write_batch(self, records):
+        for record in records:
+            self.queue.put(record)
+
+
+class SQLiteSink(Sink):
+    """
+    Batch insert tweets into a SQLite table: (tweet_id primary key, created_at, data as JSON).
+    A tweet already in the table is ignored.
+    """
+    def __init__(self, path, table='tweets', batch_size=500):
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+        import sqlite3
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (tweet_id TEXT PRIMARY KEY, created_at TEXT, data TEXT)")
+        self._db.commit()
+
+    def write_batch(self, records):
+        rows = [(record_id(record), record.get('created_at'), json.dumps(record, default=to_json)) for record in records]
+        self._db.executemany(f"INSERT OR IGNORE INTO {self.table} VALUES (?, ?, ?)", rows)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class S3Sink(Sink):
+    """
+    Upload batches of tweets as gzipped JSON lines objects to S3 or any S3-compatible store (MinIO, ...).
+    - endpoint_url: the S3-compatible endpoint, e.g. "http://localhost:9000". None for AWS
+    - client: an already configured boto3 S3 client (or anything with put_object), instead of building one
+    Objects are named <prefix><timestamp>_<sequence>.jsonl.gz. Requires boto3 unless client is given.
+    """
+    def __init__(self, bucket, prefix='twifesh/', endpoint_url=None, client=None, batch_size=5000, flush_interval=60, **client_options):
+        if client is None:
+            boto3 = optional_import('boto3', "S3Sink")
+            client = boto3.client('s3', endpoint_url=endpoint_url, **client_options)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.objects = [] #keys uploaded so far
+        self._sequence = 0
+
+    def write_batch(self, records):
+        body = io.BytesIO()
+        with gzip.GzipFile(fileobj=body, mode='wb', compresslevel=6) as file:
+            for record in records:
+                file.write(dumps(record))
+        self._sequence += 1
+        key = f"{self.prefix}{time.strftime('%Y%m%d_%H%M%S')}_{self._sequence:06d}.jsonl.gz"
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body.getvalue(), ContentType='application/json', ContentEncoding='gzip')
+        self.objects.append(key)
+
+
+class Dispatcher:
+    """
+    Fan every record out to several sinks at once.
+    Each sink gets its own bounded queue and thread, so a slow sink only ever delays (and past max_queue, drops)
+    its own records, never ingestion or the other sinks. See stats for per-sink counts.
+    """
+    def __init__(self, sinks, max_queue=10000):
+        self.sinks = list(sinks)
+        self._lanes = [_Lane(sink, max_queue) for sink in self.sinks]
+
+    def start(self):
+        for lane in self._lanes:
+            lane.start()
+        return self
+
+    def dispatch(self, record):
+        for lane in self._lanes:
+            lane.put(record)
+
+    def close(self, timeout=None):
+        """
+        Deliver what is queued, then close every sink.
+        """
+        for lane in self._lanes:
+            lane.stop(timeout)
+
+    @property
+    def stats(self):
+        """
+        {sink name: {'queued', 'written', 'dropped', 'errors'}}
+        """
+        return {f"{lane.sink.name}-{number}": lane.stats for number, lane in enumerate(self._lanes)}
+
+
+class _Lane:
+    def __init__(self, sink, max_queue):
+        self.sink = sink
+        self.queue = Queue(maxsize=max_queue)
+        self.written = self.dropped = self.errors = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'written': self.written, 'dropped': self.dropped, 'errors': self.errors}
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=f"twifesh-sink-{self.sink.name}", daemon=True)
+            self._thread.start()
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+            metrics.dropped_total.inc(stage=f"sink:{self.sink.name}")
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self.sink.close()
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.sink.flush_interval
+            while len(batch) < self.sink.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=min(remaining, 0.25)))
+                except Empty:
+                    if self._stopping.is_set():
+                        break
+            if batch:
+                try:
+                    self.sink.write_batch(batch)
+                    self.written += len(batch)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Sink {self.sink.name} failed to write {len(batch)} record(s): {e}",
+                                 extra={'event': 'sink_error', 'sink': self.sink.name, 'records': len(batch)})
+            elif self._stopping.is_set():
+                return
@@ -0,0 +1,96 @@
+import re, sys, unicodedata
+from functools import lru_cache
+
+
+EMOJI = "\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D" #emoji and pictograph blocks, variation selector, zero width joiner
+
+
+@lru_cache(maxsize=None)
+def combining_marks():
+    """
+    Character class body of every combining mark (Unicode categories Mn and Mc). re's \\w leaves them out, yet they are
+    part of the word in Devanagari, Arabic vowel signs or a decomposed 'é'. Variation selectors are left out: they belong
+    to emoji. Built on first use only (it scans all code points).
+    """
+    ranges = []
+    start = previous = None
+    for code in range(sys.maxunicode + 1):
+        if unicodedata.category(chr(code)) not in ('Mn', 'Mc') or 0xFE00 <= code <= 0xFE0F or 0xE0100 <= code <= 0xE01EF:
+            continue
+        if previous is not None and code == previous + 1:
+            previous = code
+            continue
+        if start is not None:
+            ranges.append((start, previous))
+        start = previous = code
+    ranges.append((start, previous))
+    return ''.join(re.escape(chr(first)) if first == last else f"{re.escape(chr(first))}-{re.escape(chr(last))}" for first, last in ranges)
+
+
+class TextCleaner:
+    """
+    Tweet text normalization with precompiled patterns.
+    - Links are removed, then every run of characters that are not letters or digits becomes one space
+      (the defaults give exactly the output of the original clean_tweet)
+    - keep_unicode: keep letters, digits and combining marks of any script instead of ASCII only
+    - strip_mentions / strip_hashtags: drop '@user' / '#tag' entirely instead of keeping the word
+    - strip_emoji: with False, emoji are kept as they are
+    - lowercase: lowercase the result
+    """
+    def __init__(self, keep_unicode=False, strip_mentions=False, strip_hashtags=False, strip_emoji=True, lowercase=False):
+        self.keep_unicode = keep_unicode
+        self.strip_mentions = strip_mentions
+        self.strip_hashtags = strip_hashtags
+        self.strip_emoji = strip_emoji
+        self.lowercase = lowercase
+
+        removals = [r"http\S+"]
+        self._markers = ['http']
+        if strip_mentions:
+            removals.append(r"@\w+")
+            self._markers.append('@')
+        if strip_hashtags:
+            removals.append(r"#\w+")
+            self._markers.append('#')
+        separator = f"[^\\w{combining_marks()}]|_" if keep_unicode else r"[^A-Za-z0-9]"
+        if not strip_emoji:
+            separator = f"(?![{EMOJI}]){separator}"
+        self._removal = re.compile("|".join(removals))
+        self._separator = re.compile(f"(?:{separator})+")
+
+    def clean(self, tweet):
+        if not tweet:
+            return tweet
+        #Removal pass only when the tweet can contain something to remove: most replies have no link
+        for marker in self._markers:
+            if marker in tweet:
+                tweet = self._removal.sub('', tweet)
+                break
+        tweet = self._separator.sub(' ', tweet)
+        if self.lowercase:
+            tweet = tweet.lower()
+        return tweet
+
+    __call__ = clean
+
+    def clean_many(self, tweets, processes=None, chunksize=1000):
+        """
+        Clean a list (or any iterable, e.g. a pandas Series) of tweets, returning a list.
+        processes: spread the work over this many worker processes, for large backfills.
+        """
+        if processes and processes > 1:
+            from multiprocessing import Pool
+            with Pool(processes) as pool:
+                return pool.map(self.clean, tweets, chunksize=chunksize)
+        clean = self.clean
+        return [clean(tweet) for tweet in tweets]
+
+
+default_cleaner = TextCleaner()
+
+
+def clean_tweet(tweet):
+    """
+    Clean a tweet with the default options.
+    """
+    return default_cleaner.clean(tweet)
@@ -0,0 +1,164 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils.ratelimit import RateLimiter
+from utils.helpers import API_ROOT, optional_import
+from utils import metrics
+
+
+USER_AGENT = "TwiFeshStreamerTitterAPIv2"
+
+#Errors below HTTP: refused/reset connections, timeouts (including the stream's read timeout) and broken chunked bodies
+NETWORK_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def auth_headers(bearer_token):
+    """
+    Headers sent with every call: built once per transport instead of once per request.
+    """
+    return {
+        "Authorization": f"Bearer {bearer_token}",
+        "User-Agent": USER_AGENT,
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    }
+
+
+def rebase(url, base_url):
+    """
+    Point an API url at base_url instead of the real API root.
+    """
+    if base_url and url.startswith(API_ROOT):
+        return base_url + url[len(API_ROOT):]
+    return url
+
+
+def record_call(endpoint, started, response=None, stream=False):
+    """
+    Feed one finished call into the metrics registry: count, latency, bytes and rate limit remaining per endpoint.
+    response None means the call failed below HTTP. Streamed bodies are counted by whoever reads them.
+    """
+    label = metrics.endpoint_label(endpoint)
+    metrics.request_seconds.observe(time.perf_counter() - started, endpoint=label)
+    if response is None:
+        metrics.requests_total.inc(endpoint=label, status='error')
+        return
+    metrics.requests_total.inc(endpoint=label, status=response.status_code)
+    if response.status_code == 429:
+        metrics.rate_limit_hits.inc(endpoint=label)
+    remaining = response.headers.get('x-rate-limit-remaining')
+    if remaining is not None:
+        metrics.rate_limit_remaining.set(int(remaining), endpoint=label)
+    if not stream:
+        metrics.response_bytes.inc(len(response.content), endpoint=label)
+
+
+class Transport:
+    """
+    Shared, connection-pooled HTTP session.
+    - One requests.Session with keep-alive, so pagination and lookups reuse the same TCP+TLS connection
+    - pool_connections: number of hosts to keep pools for, pool_maxsize: connections kept per host.
+      Size pool_maxsize to at least the number of threads sharing the transport (e.g. hydration workers)
+    - The auth header is set once on the session
+    - rate_limiter: schedules calls made with endpoint=... against the API's rate limit headers.
+      Everything sharing this transport shares the budget
+    - base_url: send calls for the Twitter API somewhere else, e.g. a local mock server (see benchmarks/)
+    - instrument: record every call in utils.metrics.registry (see record_call)
+    """
+    def __init__(self, bearer_token, pool_connections=4, pool_maxsize=16, max_retries=0, rate_limiter=None, base_url=None, instrument=True):
+        self.bearer_token = bearer_token
+        self.instrument = instrument
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(auth_headers(bearer_token))
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        """
+        endpoint: rate limit key of the call, e.g. Url.tweets. Calls without one are not scheduled.
+        """
+        if endpoint is not None:
+            self.rate_limiter.acquire(endpoint)
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, rebase(url, self.base_url), **kwargs)
+        except Exception:
+            if self.instrument:
+                record_call(endpoint, started)
+            raise
+        if self.instrument:
+            record_call(endpoint, started, response, stream=kwargs.get('stream', False))
+        if endpoint is not None:
+            self.rate_limiter.update(endpoint, response)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncTransport:
+    """
+    asyncio flavour of Transport with the same request/get/post surface, backed by httpx.AsyncClient.
+    Requires httpx: pip install httpx
+    """
+    def __init__(self, bearer_token, max_connections=16, max_keepalive_connections=8, timeout=None, rate_limiter=None, base_url=None, instrument=True):
+        httpx = optional_import('httpx', "AsyncTransport")
+        self.bearer_token = bearer_token
+        self.instrument = instrument
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.client = httpx.AsyncClient(
+            headers=auth_headers(bearer_token),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+            timeout=timeout,
+        )
+
+    async def request(self, method, url, endpoint=None, **kwargs):
+        import asyncio
+        if endpoint is not None:
+            wait = self.rate_limiter.try_acquire(endpoint)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.rate_limiter.try_acquire(endpoint)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, rebase(url, self.base_url), **kwargs)
+        except Exception:
+            if self.instrument:
+                record_call(endpoint, started)
+            raise
+        if self.instrument:
+            record_call(endpoint, started, response)
+        if endpoint is not None:
+            self.rate_limiter.update(endpoint, response)
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,243 @@
+import json, time, logging, threading, multiprocessing
+from queue import Empty, Full
+from utils import metrics
+
+logger = logging.getLogger('twifesh.workers')
+
+
+def _process_chunk(lines, builder, hook):
+    """
+    Parse, hydrate and run the hook over one chunk of raw stream lines. Runs in a worker process.
+    Returns (records, errors).
+    """
+    errors = []
+    tweets = []
+    for line in lines:
+        try:
+            tweet = json.loads(line)
+        except ValueError as e:
+            errors.append(f"error parsing stream line: => {e}")
+            continue
+        if 'data' in tweet:
+            tweets.append(tweet)
+
+    records = tweets
+    if builder is not None and tweets:
+        while True:
+            status, details = builder.get_tweets_details([tweet['data']['id'] for tweet in tweets], cache=False)
+            #On a rate limit the builder's scheduler holds the retry until the window resets
+            if status or 'rate limit reached' not in details:
+                break
+        if status:
+            records = details
+        else:
+            errors.append(details)
+            records = []
+
+    if hook is not None:
+        hooked = []
+        for record in records:
+            try:
+                record = hook(record)
+            except Exception as e:
+                errors.append(f"error in process hook: => {e}")
+                continue
+            if record is not None:
+                hooked.append(record)
+        records = hooked
+    return records, errors
+
+
+def _worker(inbox, outbox, settings):
+    builder = None
+    if settings['full_details']:
+        from twifesh import FeshBuilder
+        from utils.transport import Transport
+        builder = FeshBuilder(settings['bearer_token'], transport=Transport(settings['bearer_token'], base_url=settings['base_url']),
+                              fields=settings['fields'], compact=settings['compact'])
+        if settings['cleaner'] is not None:
+            builder.cleaner = settings['cleaner']
+    outbox.put((None, [], [])) #ready: imports done, chunks can come
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        sequence, lines = item
+        records, errors = _process_chunk(lines, builder, settings['hook'])
+        outbox.put((sequence, records, errors))
+
+
+class ProcessPipeline:
+    """
+    Spread CPU-heavy per-tweet work over worker processes while the stream reader only moves raw bytes.
+    - The reader's lines are grouped into chunks of up to chunk_size lines (or flush_interval seconds) and
+      sent through a bounded pipe-backed queue to `processes` workers
+    - Each worker parses its chunk, hydrates it with one lookup when full_details is set (its own connection and
+      rate limit budget), then runs hook(record) on every record: return the record (changed or not) to keep it, None to drop it
+    - deliver(record) is called in this process for every result, in stream order with ordered=True
+    - A chunk that finds the queue full is dropped and counted, so slow workers never block the stream connection
+    - start() returns once every worker has imported its modules and is taking chunks (or start_timeout has passed),
+      so the queue does not fill up while fresh processes are still starting
+    hook and cleaner are sent to the workers: they must be picklable (e.g. module level functions).
+    """
+    def __init__(self, processes, deliver, bearer_token, full_details=False, hook=None, ordered=False, base_url=None,
+                 cleaner=None, chunk_size=100, flush_interval=0.5, max_chunks=None, context='spawn', fields=None, compact=False,
+                 start_timeout=60):
+        self.processes = processes
+        self.start_timeout = start_timeout
+        self.deliver = deliver
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.settings = {'bearer_token': bearer_token, 'full_details': full_details, 'hook': hook, 'base_url': base_url, 'cleaner': cleaner,
+                         'fields': fields, 'compact': compact}
+        self._context = multiprocessing.get_context(context)
+        self._max_chunks = max_chunks or processes * 4
+        self._chunk = []
+        self._chunk_started = 0
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._pending = 0
+        self._workers = []
+        self._threads = []
+        self._stopping = threading.Event()
+        self.counters = {'received': 0, 'dropped': 0, 'processed': 0, 'delivered': 0, 'errors': 0}
+        self.lost_since = None #wall clock time of the oldest dropped chunk
+
+    def start(self):
+        if self._workers:
+            return self
+        self._stopping.clear()
+        self._inbox = self._context.Queue(maxsize=self._max_chunks)
+        self._outbox = self._context.Queue()
+        for number in range(self.processes):
+            worker = self._context.Process(target=_worker, args=(self._inbox, self._outbox, self.settings), name=f"twifesh-worker-{number}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._wait_ready()
+        for target in (self._collect, self._flush_aged):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _wait_ready(self):
+        ready = 0
+        deadline = time.monotonic() + self.start_timeout
+        while ready < len(self._workers):
+            if time.monotonic() >= deadline:
+                logger.warning(f"{len(self._workers) - ready} of {len(self._workers)} worker processes not ready after {self.start_timeout} seconds, "
+                               f"starting anyway", extra={'event': 'pipeline_slow_start'})
+                return
+            try:
+                self._outbox.get(timeout=0.25)
+                ready += 1
+            except Empty:
+                failed = [worker for worker in self._workers if worker.exitcode is not None]
+                if failed:
+                    self.stop(timeout=5)
+                    raise RuntimeError(f"Worker process {failed[0].name} exited with code {failed[0].exitcode} while starting")
+
+    def submit(self, line):
+        """
+        Queue one raw stream line (bytes).
+        """
+        with self._lock:
+            if not self._chunk:
+                self._chunk_started = time.monotonic()
+            self._chunk.append(line)
+            self.counters['received'] += 1
+            if len(self._chunk) >= self.chunk_size:
+                self._send()
+
+    def _send(self):
+        #Called with the lock held
+        chunk, self._chunk = self._chunk, []
+        try:
+            self._inbox.put_nowait((self._sequence, chunk))
+        except Full:
+            self.counters['dropped'] += len(chunk)
+            metrics.dropped_total.inc(len(chunk), stage='pipeline')
+            if self.lost_since is None:
+                self.lost_since = time.time() - (time.monotonic() - self._chunk_started)
+            if self.ordered:
+                #Keep the sequence gapless so ordered delivery does not wait for a chunk that never comes
+                self._outbox.put((self._sequence, [], []))
+            else:
+                return
+        self._sequence += 1
+        self._pending += 1
+
+    def _flush_aged(self):
+        while not self._stopping.is_set():
+            time.sleep(self.flush_interval / 2)
+            with self._lock:
+                if self._chunk and time.monotonic() - self._chunk_started >= self.flush_interval:
+                    self._send()
+
+    def _collect(self):
+        waiting = {}
+        next_sequence = 0
+        while True:
+            with self._lock:
+                if self._stopping.is_set() and self._pending == 0:
+                    return
+            try:
+                sequence, records, errors = self._outbox.get(timeout=0.25)
+            except Empty:
+                if self._stopping.is_set():
+                    return #workers are gone and everything they sent has been delivered
+                continue
+            if self.ordered:
+                waiting[sequence] = (records, errors)
+                while next_sequence in waiting:
+                    self._deliver(*waiting.pop(next_sequence))
+                    next_sequence += 1
+            else:
+                self._deliver(records, errors)
+
+    def _deliver(self, records, errors):
+        with self._lock:
+            self._pending -= 1
+            self.counters['processed'] += 1
+            self.counters['errors'] += len(errors)
+        for error in errors:
+            logger.error(error, extra={'event': 'pipeline_error'})
+        for record in records:
+            self.deliver(record)
+        with self._lock:
+            self.counters['delivered'] += len(records)
+
+    def stop(self, timeout=None):
+        """
+        Send what is buffered, let the workers finish the queued chunks, then stop them.
+        """
+        if not self._workers:
+            return
+        with self._lock:
+            if self._chunk:
+                self._send()
+        for _ in self._workers:
+            try:
+                self._inbox.put(None, timeout=timeout)
+            except Full:
+                break #workers are not consuming: join below times out and they are terminated
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._workers = []
+        self._threads = []
+
+    @property
+    def stats(self):
+        """
+        Tweets received and dropped, chunks processed and in flight, records delivered, errors.
+        """
+        with self._lock:
+            stats = dict(self.counters)
+            stats['in_flight'] = self._pending
+        return stats
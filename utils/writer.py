@@ -0,0 +1,185 @@
+import io, os, gzip, json, time, threading
+from queue import Queue, Empty
+from utils.records import record_id
+from utils.helpers import optional_import
+
+try:
+    import orjson
+except ImportError: #optional: faster serialization
+    orjson = None
+
+
+def to_json(value):
+    """
+    default= hook for json/orjson: compact records (utils.records) are written as the dicts they stand for.
+    """
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(record):
+    """
+    Serialize one record to a JSON line (bytes). Uses orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(record, default=to_json) + b'\n'
+    return json.dumps(record, default=to_json).encode('utf-8') + b'\n'
+
+
+def read_ids(*paths):
+    """
+    Tweet ids of every record in JSON lines files written by TwiFesh (plain, .gz or .zst), e.g. a Stream's output parts,
+    to pass as Search(seen=...).
+    """
+    ids = set()
+    for path in paths:
+        if path.endswith('.gz'):
+            file = gzip.open(path, 'rb')
+        elif path.endswith('.zst'):
+            zstandard = optional_import('zstandard', "Reading .zst files")
+            file = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+            file = io.BufferedReader(file)
+        else:
+            file = open(path, 'rb')
+        with file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    tweet_id = record_id(json.loads(line))
+                    if tweet_id:
+                        ids.add(tweet_id)
+    return ids
+
+
+class JsonlWriter:
+    """
+    Buffered JSON lines file writer running on a background thread.
+    - write() only queues the record: serialization and disk I/O happen on the writer thread
+    - The buffer is written out once it holds flush_size bytes or flush_interval seconds have passed
+    - fsync: 'never' (leave it to the OS), 'flush' (after every buffer write) or 'rotate' (when a file is closed)
+    - rotate_bytes / rotate_seconds: start a new file part once the current one is this big or this old.
+      Parts are named <name>_0001.json, <name>_0002.json, ... With no rotation the path is used as is
+    - compression: None, 'gzip' or 'zstd' (needs zstandard). Adds .gz/.zst to the file name
+    """
+    extensions = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, path, flush_interval=1.0, flush_size=1 << 16, fsync='never', rotate_bytes=None, rotate_seconds=None, compression=None, max_queue=100000):
+        if compression not in self.extensions:
+            raise ValueError(f"Unknown compression '{compression}'. Use one of {list(self.extensions)}")
+        self._zstandard = optional_import('zstandard', "compression='zstd'") if compression == 'zstd' else None
+        if fsync not in ('never', 'flush', 'rotate'):
+            raise ValueError(f"Unknown fsync policy '{fsync}'. Use 'never', 'flush' or 'rotate'")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compression = compression
+        self.queue = Queue(maxsize=max_queue)
+        self.files = [] #every file part written so far
+        self.records = 0
+        self._part = 0
+        self._raw = None
+        self._file = None
+        self._opened_at = 0
+        self._part_bytes = 0
+        self._thread = None
+        self._closed = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="twifesh-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def write(self, record):
+        """
+        Queue a record (any json serializable object) for writing. Blocks only if the queue is full.
+        """
+        if self._thread is None:
+            self.start()
+        self.queue.put(record)
+
+    def close(self, timeout=None):
+        """
+        Write out everything queued, then close the current file.
+        """
+        if self._thread is None:
+            return
+        self._closed.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _name(self):
+        name = self.path
+        if self.rotate_bytes or self.rotate_seconds:
+            stem, ext = os.path.splitext(self.path)
+            name = f"{stem}_{self._part:04d}{ext}"
+        return name + self.extensions[self.compression]
+
+    def _open(self):
+        self._part += 1
+        name = self._name()
+        self._raw = open(name, 'ab')
+        if self.compression == 'gzip':
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='ab', compresslevel=6)
+        elif self.compression == 'zstd':
+            self._file = self._zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._file = self._raw
+        self._opened_at = time.monotonic()
+        self._part_bytes = 0
+        self.files.append(name)
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.flush()
+        if self.fsync in ('flush', 'rotate'):
+            os.fsync(self._raw.fileno())
+        self._raw.close()
+        self._file = self._raw = None
+
+    def _flush(self, buffer):
+        if not buffer:
+            return
+        if self._file is None:
+            self._open()
+        self._file.write(buffer)
+        self._part_bytes += len(buffer)
+        if self._file is not self._raw:
+            self._file.flush()
+        self._raw.flush()
+        if self.fsync == 'flush':
+            os.fsync(self._raw.fileno())
+        buffer.clear()
+        if (self.rotate_bytes and self._part_bytes >= self.rotate_bytes) or \
+           (self.rotate_seconds and time.monotonic() - self._opened_at >= self.rotate_seconds):
+            self._close_file()
+
+    def _run(self):
+        buffer = bytearray()
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+                buffer += dumps(record)
+                self.records += 1
+            except Empty:
+                if self._closed.is_set():
+                    break
+            if len(buffer) >= self.flush_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush(buffer)
+                last_flush = time.monotonic()
+        self._flush(buffer)
+        self._close_file()